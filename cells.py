@@ -1,12 +1,1506 @@
+import time
+_PROCESS_START = time.perf_counter() # Reference point for the startup budget
+
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, simpledialog
-from openpyxl import load_workbook, Workbook
 import csv
+import codecs
+import io
+import importlib
+import importlib.util
 import os
+import sys
 from collections import deque
 import re 
+import json
+import operator
+import tempfile
+import hashlib
+import marshal
 import subprocess # Needed to open links for documentation
 
+# --- Startup Settings ---
+# openpyxl is imported lazily (only when an Excel file is opened or saved)
+# so that CSV-only sessions start quickly.
+STARTUP_BUDGET_MS = 1500
+
+# --- Delimited Text Settings ---
+CSV_EXTENSIONS = (".csv", ".tsv", ".txt")
+COMPRESSION_MODULES = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"} # Imported on first use
+CSV_SAMPLE_BYTES = 64 * 1024 # Bounded sample used to sniff encoding and delimiter
+SNIFF_DELIMITERS = ",\t;|"
+DEFAULT_CSV_FORMAT = {"encoding": "utf-8", "delimiter": ",", "quotechar": '"'}
+FOLLOW_POLL_MS = 1000 # How often a followed file is checked for appended rows
+CSV_FILETYPES = ("*.csv *.tsv *.txt *.csv.gz *.tsv.gz *.txt.gz *.csv.bz2 *.tsv.bz2 *.txt.bz2 "
+                 "*.csv.xz *.tsv.xz *.txt.xz")
+
+# --- Columnar Format Settings (optional, requires pyarrow) ---
+COLUMNAR_EXTENSIONS = {".parquet": "parquet", ".feather": "feather", ".arrow": "feather", ".ipc": "feather"}
+COLUMNAR_FILETYPES = "*.parquet *.feather *.arrow *.ipc"
+COLUMN_PICKER_THRESHOLD = 20 # Offer column projection for files wider than this
+
+# --- Out-of-Core (SQLite) Settings ---
+OUT_OF_CORE_SUGGEST_BYTES = 500 * 1024 * 1024 # Offer out-of-core mode for files larger than this
+STORE_BATCH_ROWS = 10000
+ROW_HEIGHT = 25 # Must match the Treeview rowheight style
+
+# --- Column Virtualization Settings ---
+COLUMN_WIDTH = 120
+DEFAULT_VIEW_WIDTH = 1000 # Used until the grid has been drawn and knows its real width
+
+# --- Compare Settings ---
+DIFF_LIST_LIMIT = 1000 # Changes listed in the comparison summary (all are counted and highlighted)
+DIFF_COLORS = {"diff_added": "#1e4d2b", "diff_modified": "#5c4a14"}
+
+# --- Crash Recovery Journal Settings ---
+JOURNAL_SUFFIX = ".cells-journal"
+JOURNAL_FLUSH_OPS = 64    # Flush to disk once this many edits are buffered...
+JOURNAL_FLUSH_MS = 2000   # ...or this long after the first buffered edit.
+
+# --- Memory Diagnostics Settings ---
+MEMORY_SAMPLE_ROWS = 20000 # Rows (or workbook cells) measured per table; larger ones are extrapolated
+
+# --- Parsed File Cache Settings ---
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cells")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_MAX_ENTRY_FRACTION = 0.25 # Larger entries are not cached, so one big file cannot flush the rest
+
+# --- Delimited Text I/O (plain or gzip/bz2/xz compressed) ---
+def _split_compression(file_path):
+    """Returns (path without compression suffix, compression module name or None)."""
+    root, ext = os.path.splitext(file_path)
+    module = COMPRESSION_MODULES.get(ext.lower())
+    return (root, module) if module else (file_path, None)
+
+def _is_delimited_path(file_path):
+    return _split_compression(file_path)[0].lower().endswith(CSV_EXTENSIONS)
+
+class _BoundedReader(io.RawIOBase):
+    """Raw reader over the first `limit` bytes of a file, so a file that is still being
+    appended to is read up to a fixed size."""
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+def _open_text(file_path, mode, encoding, limit=None):
+    """Opens a (possibly compressed) text file for streaming csv reading or writing.
+    `limit` reads only the first bytes of an uncompressed file."""
+    module = _split_compression(file_path)[1]
+    if limit is not None and not module:
+        return io.TextIOWrapper(io.BufferedReader(_BoundedReader(open(file_path, "rb"), limit)), encoding=encoding, newline="")
+    if module:
+        return importlib.import_module(module).open(file_path, mode + "t", encoding=encoding, newline="")
+    return open(file_path, mode, encoding=encoding, newline="")
+
+def _detect_encoding(sample):
+    if sample.startswith(codecs.BOM_UTF8): return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)): return "utf-16"
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            # Incremental so a multi-byte character cut off at the end of the sample is not an error.
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+def _sniff_csv_format(file_path):
+    """Detects encoding, delimiter and quote character from the start of the (decompressed) file."""
+    module = _split_compression(file_path)[1]
+    opener = importlib.import_module(module).open if module else open
+    with opener(file_path, "rb") as f:
+        sample = f.read(CSV_SAMPLE_BYTES)
+    encoding = _detect_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+    if len(sample) == CSV_SAMPLE_BYTES and "\n" in text:
+        text = text[:text.rfind("\n") + 1] # Only sniff complete lines.
+    csv_format = _default_csv_format(file_path, DEFAULT_CSV_FORMAT)
+    csv_format["encoding"] = encoding
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=SNIFF_DELIMITERS)
+        csv_format["delimiter"] = dialect.delimiter
+        csv_format["quotechar"] = dialect.quotechar or '"'
+    except csv.Error:
+        pass # Not enough structure to tell; keep the extension's default.
+    return csv_format
+
+def _default_csv_format(file_path, current):
+    """Format for writing file_path: keeps `current`, but .tsv always means tabs and .csv never does."""
+    csv_format = dict(current)
+    ext = os.path.splitext(_split_compression(file_path)[0])[1].lower()
+    if ext == ".tsv":
+        csv_format["delimiter"] = "\t"
+    elif ext == ".csv" and csv_format["delimiter"] == "\t":
+        csv_format["delimiter"] = ","
+    return csv_format
+
+def _read_delimited(file_path, limit=None):
+    """Streams a delimited file (only its first `limit` bytes if given) into a list of rows.
+    Returns (csv_format, rows)."""
+    csv_format = _sniff_csv_format(file_path)
+    try:
+        with _open_text(file_path, "r", csv_format["encoding"], limit) as f:
+            rows = list(csv.reader(f, delimiter=csv_format["delimiter"], quotechar=csv_format["quotechar"]))
+    except UnicodeDecodeError:
+        # The sample decoded cleanly but a later byte did not; latin-1 accepts everything.
+        csv_format["encoding"] = "latin-1"
+        with _open_text(file_path, "r", csv_format["encoding"], limit) as f:
+            rows = list(csv.reader(f, delimiter=csv_format["delimiter"], quotechar=csv_format["quotechar"]))
+    return csv_format, rows
+
+def _complete_lines_end(file_path, size):
+    """Byte offset just past the last newline in the first `size` bytes of a file (0 if none)."""
+    with open(file_path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - CSV_SAMPLE_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0: return start + newline + 1
+            end = start
+    return 0
+
+def _read_appended(file_path, offset, csv_format):
+    """Parses the rows appended to an uncompressed delimited file after byte `offset`, up to
+    the last complete line (a line still being written is picked up on the next read).
+    Returns (rows, new offset), or None if the file is now shorter (truncated or replaced)."""
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size < offset: return None
+        if size == offset: return [], offset
+        f.seek(offset)
+        chunk = f.read(size - offset)
+    end = chunk.rfind(b"\n") + 1
+    if not end: return [], offset
+    text = chunk[:end].decode(csv_format["encoding"], errors="replace")
+    rows = list(csv.reader(io.StringIO(text, newline=""), delimiter=csv_format["delimiter"], quotechar=csv_format["quotechar"]))
+    return rows, offset + end
+
+def _write_delimited(file_path, headers, rows, csv_format):
+    """Writes the table; returns the number of (uncompressed) bytes written.
+
+    The table is written under a temporary name in the same folder and only then
+    replaces file_path, so a failed write (e.g. UnicodeEncodeError for text the
+    encoding cannot hold) leaves the original file intact.
+    """
+    partial = os.path.join(os.path.dirname(file_path), ".partial-" + os.path.basename(file_path))
+    try:
+        with _open_text(partial, "w", csv_format["encoding"]) as f:
+            writer = csv.writer(f, delimiter=csv_format["delimiter"], quotechar=csv_format["quotechar"])
+            writer.writerow(headers)
+            writer.writerows(rows)
+            f.flush()
+            written = f.buffer.tell()
+        if os.path.exists(file_path):
+            import shutil
+            shutil.copymode(file_path, partial)
+        os.replace(partial, file_path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return written
+
+# --- Columnar I/O (Parquet / Arrow IPC "Feather") ---
+def _pyarrow_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+def _columnar_kind(file_path):
+    """Returns "parquet", "feather" or None for file_path's extension."""
+    return COLUMNAR_EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+
+def _read_columnar_schema(file_path):
+    """Reads only the schema (file footer), not the data."""
+    if _columnar_kind(file_path) == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(file_path)
+    import pyarrow.ipc as ipc
+    with ipc.open_file(file_path) as reader:
+        return reader.schema
+
+def _column_to_text(column):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    try:
+        # Format in Arrow's C++ kernels rather than calling str() per value.
+        return pc.fill_null(pc.cast(column, pa.string()), "").to_pylist()
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return ["" if value is None else str(value) for value in column.to_pylist()]
+
+def _read_columnar(file_path, columns=None):
+    """Loads a Parquet/Feather file, reading only `columns` when given. Returns (schema, headers, rows)."""
+    if _columnar_kind(file_path) == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(file_path, columns=columns)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+    text_columns = [_column_to_text(column) for column in table.columns]
+    rows = [list(row) for row in zip(*text_columns)]
+    return table.schema, table.column_names, rows
+
+def _write_columnar(file_path, headers, rows, schema=None):
+    """Writes rows to Parquet/Feather. Columns are cast back to their type in `schema`
+    (the file they were loaded from) when every value still parses; otherwise they stay text."""
+    import pyarrow as pa
+    original_types = {field.name: field.type for field in schema} if schema is not None else {}
+    arrays = []
+    for i, name in enumerate(headers):
+        values = [row[i] if i < len(row) else "" for row in rows]
+        array = pa.array(values, type=pa.string())
+        target = original_types.get(name)
+        if target is not None and not pa.types.is_string(target):
+            try:
+                array = pa.array([value if value != "" else None for value in values], type=pa.string()).cast(target)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        arrays.append(array)
+    table = pa.Table.from_arrays(arrays, names=list(headers))
+    if _columnar_kind(file_path) == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, file_path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, file_path)
+
+# --- Streaming Row Sources ---
+def _cell_text(value):
+    return str(value) if value is not None else ""
+
+def _iter_source_rows(file_path, sheet_name=None, csv_format=None):
+    """Yields the rows of a file one at a time (header row first) without loading it all.
+
+    Supports Excel (openpyxl read-only mode), delimited text and Parquet/Feather.
+    """
+    if file_path.lower().endswith((".xlsx", ".xls")):
+        from openpyxl import load_workbook
+        workbook = load_workbook(filename=file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+            for row in sheet.iter_rows(values_only=True):
+                yield [_cell_text(v) for v in row]
+        finally:
+            workbook.close()
+    elif _columnar_kind(file_path):
+        if _columnar_kind(file_path) == "parquet":
+            import pyarrow.parquet as pq
+            source = pq.ParquetFile(file_path)
+            yield list(source.schema_arrow.names)
+            batches = source.iter_batches(batch_size=STORE_BATCH_ROWS)
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(file_path, memory_map=True)
+            yield list(table.column_names)
+            batches = table.to_batches(max_chunksize=STORE_BATCH_ROWS)
+        for batch in batches:
+            for row in zip(*[_column_to_text(column) for column in batch.columns]):
+                yield list(row)
+    else:
+        csv_format = csv_format or _sniff_csv_format(file_path)
+        with _open_text(file_path, "r", csv_format["encoding"]) as f:
+            yield from csv.reader(f, delimiter=csv_format["delimiter"], quotechar=csv_format["quotechar"])
+
+# --- Search Filter ---
+def _search_matcher(headers, query):
+    """Builds the row test for a search query: a keyword found in any cell, or
+    Column:value1,value2 found in one column (case-insensitive substrings).
+    Returns (predicate, column index or None, values); raises ValueError for an unknown column."""
+    if ":" in query:
+        col_name, values = query.split(":", 1)
+        col_name = col_name.strip()
+        values_list = [v.strip().lower() for v in values.split(",") if v.strip()]
+        if col_name not in headers:
+            raise ValueError(f"Column '{col_name}' not found.")
+        col_index = headers.index(col_name)
+        def matches(row):
+            cell = row[col_index] if col_index < len(row) else ""
+            return bool(cell) and any(val in str(cell).lower() for val in values_list)
+        return matches, col_index, values_list
+    value = query.lower()
+    return (lambda row: any(cell and value in str(cell).lower() for cell in row)), None, [value]
+
+# --- Streaming Export ---
+def _write_excel_table(file_path, sheet_name, headers, rows):
+    """Writes one sheet with openpyxl's write-only mode, consuming `rows` as it goes."""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    ws = workbook.create_sheet(title=sheet_name or "Sheet1")
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    workbook.save(file_path)
+
+def _export_table(file_path, headers, rows, csv_format=None, sheet_name=None):
+    """Writes headers and an iterable of rows to a new file, picking the format from its extension."""
+    if file_path.lower().endswith(".xlsx"):
+        _write_excel_table(file_path, sheet_name, headers, rows)
+    elif _columnar_kind(file_path):
+        if not _pyarrow_available():
+            raise RuntimeError("Parquet/Feather support requires pyarrow (pip install pyarrow).")
+        _write_columnar(file_path, headers, list(rows)) # Arrow builds whole columns at once.
+    else:
+        _write_delimited(file_path, headers, rows, _default_csv_format(file_path, csv_format or DEFAULT_CSV_FORMAT))
+
+# --- Row/Column Operations (shared by the editor and journal replay) ---
+def _sort_value(val):
+    """Sort key for a cell: numbers compare numerically, everything else case-insensitively."""
+    try:
+        if isinstance(val, (int, float)): return float(val)
+        return float(str(val).strip())
+    except (ValueError, TypeError):
+        return str(val).lower()
+
+def _ranked_sort_value(val):
+    """_sort_value ranked so numbers and text can be compared: numbers first, then text
+    (as SQLite orders them for out-of-core tables)."""
+    value = _sort_value(val)
+    return (1, value) if isinstance(value, str) else (0, value)
+
+def _sort_rows(rows, col_index, reverse):
+    def sort_key(row):
+        return _ranked_sort_value(row[col_index] if col_index < len(row) else "")
+    rows.sort(key=sort_key, reverse=reverse)
+
+def _apply_op(rows, columns, op):
+    """Applies a single edit operation to rows/columns in place."""
+    kind = op[0]
+    if kind == "set":
+        _, row_index, col_index, value = op
+        row = rows[row_index]
+        if col_index >= len(row):
+            row.extend([""] * (col_index - len(row) + 1))
+        row[col_index] = value
+    elif kind == "insert_row":
+        rows.insert(op[1], [""] * len(columns))
+    elif kind == "delete_row":
+        del rows[op[1]]
+    elif kind == "swap_rows":
+        _, a, b = op
+        rows[a], rows[b] = rows[b], rows[a]
+    elif kind == "insert_col":
+        _, col_index, col_name = op
+        columns.insert(col_index, col_name)
+        for row in rows:
+            if col_index > len(row):
+                row.extend([""] * (col_index - len(row)))
+            row.insert(col_index, "")
+    elif kind == "delete_col":
+        col_index = op[1]
+        columns.pop(col_index)
+        for row in rows:
+            if col_index < len(row):
+                row.pop(col_index)
+    elif kind == "swap_cols":
+        _, a, b = op
+        columns[a], columns[b] = columns[b], columns[a]
+        for row in rows:
+            if b < len(row):
+                row[a], row[b] = row[b], row[a]
+    elif kind == "rename_col":
+        columns[op[1]] = op[2]
+    elif kind == "sort":
+        _sort_rows(rows, op[1], op[2])
+    elif kind == "drop_rows":
+        dropped = set(op[1])
+        rows[:] = [row for i, row in enumerate(rows) if i not in dropped]
+    elif kind == "reset":
+        columns[:] = op[1]
+        rows[:] = [list(row) for row in op[2]]
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+
+def _replay_journal(records, rows, columns, history_size):
+    """Re-applies journal records on top of the saved file contents.
+
+    Every record is one undo step, so the editor's history is rebuilt alongside
+    and "goto" records (undo/redo) resolve to the same snapshots they did live;
+    a "trim" record drops every snapshot but the current one, as it did live.
+    Returns (history, history_index).
+    """
+    history = deque([([list(row) for row in rows], list(columns))], maxlen=history_size)
+    index = 0
+    for ops in records:
+        if ops and ops[0][0] == "trim":
+            history = deque([history[index]], maxlen=history_size)
+            index = 0
+            continue
+        if ops and ops[0][0] == "goto":
+            index = ops[0][1]
+            snapshot_rows, snapshot_columns = history[index]
+            rows[:] = [list(row) for row in snapshot_rows]
+            columns[:] = snapshot_columns
+            continue
+        for op in ops:
+            _apply_op(rows, columns, op)
+        while len(history) > index + 1:
+            history.pop()
+        history.append(([list(row) for row in rows], list(columns)))
+        index = len(history) - 1
+    return history, index
+
+# --- Memory Accounting ---
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _rows_footprint(rows, seen):
+    """Estimates the bytes held by a list of row lists: the lists plus the cell objects
+    not already in `seen` (so cells shared with another table count once). Large
+    tables are sampled evenly and extrapolated."""
+    total = sys.getsizeof(rows)
+    if not rows: return total
+    step = max(1, len(rows) // MEMORY_SAMPLE_ROWS)
+    sampled = measured = 0
+    for row in rows[::step]:
+        sampled += 1
+        measured += sys.getsizeof(row)
+        for cell in row:
+            if id(cell) not in seen:
+                seen.add(id(cell))
+                measured += sys.getsizeof(cell)
+    return total + measured * len(rows) // sampled
+
+def _workbook_footprint(workbook):
+    """Estimates the memory of an openpyxl workbook from a sample of its cell objects.
+    Returns (bytes, cell count)."""
+    count = 0
+    sampled = measured = 0
+    for ws in workbook.worksheets:
+        cells = getattr(ws, "_cells", {}) # openpyxl keeps each sheet's Cell objects in this dict
+        count += len(cells)
+        for key, cell in cells.items():
+            if sampled >= MEMORY_SAMPLE_ROWS: break
+            sampled += 1
+            # Cell object, its value and its coordinate key; the dict slot is roughly 3 pointers.
+            measured += sys.getsizeof(cell) + sys.getsizeof(cell.value) + sys.getsizeof(key) + 24
+    return (measured * count // sampled if sampled else 0), count
+
+def _process_rss():
+    """Resident memory of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+def _traced_memory_by_package():
+    """Groups tracemalloc's live allocations by the package that made them."""
+    import tracemalloc
+    groups = {}
+    for stat in tracemalloc.take_snapshot().statistics("filename"):
+        path = stat.traceback[0].filename.replace("\\", "/")
+        if os.path.basename(path) == "cells.py":
+            group = "cells.py (rows, history, caches)"
+        else:
+            group = next((name for name in ("openpyxl", "tkinter", "pyarrow", "sqlite3", "csv") if f"/{name}/" in path or path.endswith(f"/{name}.py")), "other")
+        groups[group] = groups.get(group, 0) + stat.size
+    return sorted(groups.items(), key=lambda item: -item[1])
+
+# --- Dedupe / Group By (single hashed pass) ---
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+
+def _row_key(row, col_indices):
+    return tuple(row[i] if i < len(row) else "" for i in col_indices)
+
+def _duplicate_row_indices(rows, key_cols):
+    """Returns the indices of rows whose key columns repeat an earlier row (all columns if empty)."""
+    seen = set()
+    duplicates = []
+    for i, row in enumerate(rows):
+        key = _row_key(row, key_cols) if key_cols else tuple(row)
+        if key in seen:
+            duplicates.append(i)
+        else:
+            seen.add(key)
+    return duplicates
+
+def _to_number(val):
+    try:
+        return float(str(val).strip())
+    except ValueError:
+        return None
+
+def _format_number(x):
+    return str(int(x)) if x.is_integer() and abs(x) < 1e15 else f"{x:.15g}"
+
+def _group_rows(rows, key_cols, value_col, aggregates):
+    """Groups rows by the key columns in one pass, keeping running totals per group.
+
+    `count` counts rows; the other aggregates use the numeric cells of value_col.
+    Returns one row per group (key values, then aggregates) in first-seen group order.
+    """
+    groups = {}
+    for row in rows:
+        key = _row_key(row, key_cols)
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = [0, 0, 0.0, None, None] # rows, numeric cells, sum, min, max
+        acc[0] += 1
+        if value_col is None: continue
+        number = _to_number(row[value_col]) if value_col < len(row) else None
+        if number is None: continue
+        acc[1] += 1
+        acc[2] += number
+        if acc[3] is None or number < acc[3]: acc[3] = number
+        if acc[4] is None or number > acc[4]: acc[4] = number
+
+    result = []
+    for key, (count, numeric, total, low, high) in groups.items():
+        values = {
+            "count": str(count),
+            "sum": _format_number(total) if numeric else "",
+            "mean": _format_number(total / numeric) if numeric else "",
+            "min": _format_number(low) if numeric else "",
+            "max": _format_number(high) if numeric else "",
+        }
+        result.append(list(key) + [values[name] for name in aggregates])
+    return result
+
+# --- Pivot (single hashed pass) ---
+PIVOT_BLANK_LABEL = "(blank)"
+
+def _label_order(labels):
+    """Orders pivot labels like a sort: numbers numerically first, then text case-insensitively."""
+    return sorted(labels, key=_ranked_sort_value)
+
+def _pivot_rows(rows, row_col, col_col, value_col, aggregate, row_name="", total_label="Total"):
+    """Cross-tabulates rows by the labels of row_col (down) and col_col (across).
+
+    One pass accumulates [rows, numeric cells, sum, min, max] per label pair; the
+    grand totals are combined from those accumulators afterwards. `count` counts
+    rows; the other aggregates use the numeric cells of value_col.
+    Returns (headers, rows) with a total column and a total row.
+    """
+    cells = {}
+    if value_col is None or aggregate == "count":
+        getter = _row_key_getter([row_col, col_col])
+        for key in map(getter, rows):
+            acc = cells.get(key)
+            if acc is None:
+                cells[key] = [1, 0, 0.0, None, None]
+            else:
+                acc[0] += 1
+    else:
+        getter = _row_key_getter([row_col, col_col, value_col])
+        for r, c, value in map(getter, rows):
+            acc = cells.get((r, c))
+            if acc is None:
+                acc = cells[(r, c)] = [0, 0, 0.0, None, None]
+            acc[0] += 1
+            try:
+                number = float(value)
+            except (ValueError, TypeError):
+                continue
+            acc[1] += 1
+            acc[2] += number
+            if acc[3] is None or number < acc[3]: acc[3] = number
+            if acc[4] is None or number > acc[4]: acc[4] = number
+
+    def combine(total, acc):
+        total[0] += acc[0]
+        total[1] += acc[1]
+        total[2] += acc[2]
+        if acc[3] is not None and (total[3] is None or acc[3] < total[3]): total[3] = acc[3]
+        if acc[4] is not None and (total[4] is None or acc[4] > total[4]): total[4] = acc[4]
+
+    row_totals, col_totals, grand = {}, {}, [0, 0, 0.0, None, None]
+    for (r, c), acc in cells.items():
+        combine(row_totals.setdefault(r, [0, 0, 0.0, None, None]), acc)
+        combine(col_totals.setdefault(c, [0, 0, 0.0, None, None]), acc)
+        combine(grand, acc)
+
+    def result(acc):
+        if acc is None: return ""
+        count, numeric, total, low, high = acc
+        if aggregate == "count": return str(count)
+        if not numeric: return ""
+        if aggregate == "sum": return _format_number(total)
+        if aggregate == "mean": return _format_number(total / numeric)
+        return _format_number(low if aggregate == "min" else high)
+
+    row_labels = _label_order(row_totals)
+    col_labels = _label_order(col_totals)
+    names = [str(c) if c != "" else PIVOT_BLANK_LABEL for c in col_labels]
+    headers = [row_name] + _unique_names([row_name, total_label], names) + [total_label]
+    table = []
+    for r in row_labels:
+        table.append([r if r != "" else PIVOT_BLANK_LABEL] + [result(cells.get((r, c))) for c in col_labels] + [result(row_totals[r])])
+    table.append([total_label] + [result(col_totals[c]) for c in col_labels] + [result(grand)])
+    return headers, table
+
+# --- Row Comparison ---
+def _row_key_getter(col_indices):
+    """Fast key function for the given columns (short rows are padded with "")."""
+    if not col_indices: return lambda row: ()
+    getter = operator.itemgetter(*col_indices)
+    width = max(col_indices) + 1
+    def key(row):
+        if len(row) >= width: return getter(row)
+        return getter(list(row) + [""] * (width - len(row)))
+    return key
+
+def _diff_rows(old_rows, new_rows, columns, key_cols=None):
+    """Compares two tables with one hashed pass over each.
+
+    Without key columns rows are matched on all `columns` (repeated rows are
+    matched one to one); with key columns, rows with the same key are paired and
+    compared cell by cell. Returns (added new-row indices, removed old-row indices,
+    {new-row index: (old-row index, changed columns)}).
+    """
+    key = _row_key_getter(key_cols or columns)
+    old_keys = list(map(key, old_rows))
+    # First occurrence of each key; repeated keys queue up behind it.
+    first = dict(zip(reversed(old_keys), range(len(old_keys) - 1, -1, -1)))
+    repeats = {}
+    if len(first) < len(old_keys):
+        for i, k in enumerate(old_keys):
+            if first[k] != i:
+                repeats.setdefault(k, deque()).append(i)
+    del old_keys
+
+    added, modified = [], {}
+    row_cells = _row_key_getter(columns)
+    for i, row in enumerate(new_rows):
+        k = key(row)
+        j = first.pop(k, None)
+        if j is None:
+            queue = repeats.get(k)
+            if not queue:
+                added.append(i)
+                continue
+            j = queue.popleft()
+        if key_cols:
+            new_cells, old_cells = row_cells(row), row_cells(old_rows[j])
+            if new_cells != old_cells:
+                if len(columns) == 1: new_cells, old_cells = (new_cells,), (old_cells,)
+                modified[i] = (j, [c for c, a, b in zip(columns, new_cells, old_cells) if a != b])
+    removed = sorted([*first.values(), *(j for queue in repeats.values() for j in queue)])
+    return added, removed, modified
+
+# --- Hash Join ---
+def _unique_names(existing, names):
+    """Returns `names` renamed where needed so none clashes with `existing` or each other."""
+    taken = set(existing)
+    result = []
+    for name in names:
+        candidate, n = name, 2
+        while candidate in taken:
+            candidate = f"{name}_{n}"
+            n += 1
+        taken.add(candidate)
+        result.append(candidate)
+    return result
+
+def _join_rows(left_rows, right_rows, left_keys, right_keys, right_cols, how="left", width=0):
+    """Joins rows on key columns, appending right_cols of each matching right row
+    (after padding left rows to `width` cells).
+
+    The hash table is built on the smaller side and the other side is scanned once.
+    A left row matching several right rows is repeated (SQL semantics); with
+    how="left" unmatched left rows are kept with blank appended cells.
+    """
+    blank = [""] * len(right_cols)
+    if len(right_rows) <= len(left_rows):
+        table = {}
+        for row in right_rows:
+            table.setdefault(_row_key(row, right_keys), []).append(_row_key(row, right_cols))
+        lookup = lambda i, row: table.get(_row_key(row, left_keys))
+    else:
+        index = {}
+        for i, row in enumerate(left_rows):
+            index.setdefault(_row_key(row, left_keys), []).append(i)
+        matches = {}
+        for row in right_rows:
+            for i in index.get(_row_key(row, right_keys), ()):
+                matches.setdefault(i, []).append(_row_key(row, right_cols))
+        lookup = lambda i, row: matches.get(i)
+
+    result = []
+    for i, row in enumerate(left_rows):
+        found = lookup(i, row)
+        if len(row) < width:
+            row = list(row) + [""] * (width - len(row))
+        if found:
+            result.extend(list(row) + list(values) for values in found)
+        elif how == "left":
+            result.append(list(row) + blank)
+    return result
+
+# --- Formula Engine ---
+# Evaluates a common subset of spreadsheet formulas on the sheet grid. Row 1 of the
+# sheet is the header row, so cell A2 is data_rows[0][0]; references are kept in data
+# coordinates (header row = -1).
+class FormulaError(Exception):
+    """An Excel-style error value (#DIV/0!, #VALUE!, ...) raised during evaluation."""
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+_FORMULA_TOKEN = re.compile(r"""\s*(?:
+    (?P<string>"(?:[^"]|"")*")
+  | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d+|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3})(?![\w(])
+  | (?P<ref>\$?[A-Za-z]{1,3}\$?\d+)(?![\w(!])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+  | (?P<op><>|<=|>=|[-+*/^&=<>(),%!])
+)""", re.VERBOSE)
+_CELL_REF = re.compile(r"\$?([A-Za-z]{1,3})(?:\$?(\d+))?")
+_NUMBER_TEXT = re.compile(r"\s*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\s*$")
+
+def _column_number(letters):
+    number = 0
+    for ch in letters.upper():
+        number = number * 26 + ord(ch) - 64
+    return number - 1
+
+def _parse_cell_ref(text):
+    """'B3' -> (1, 1) in data coordinates; a bare column ('B') has row None."""
+    letters, digits = _CELL_REF.fullmatch(text).groups()
+    return (int(digits) - 2 if digits else None), _column_number(letters)
+
+def _tokenize_formula(text):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _FORMULA_TOKEN.match(text, pos)
+        if not match: raise FormulaError("#ERROR!")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+class _FormulaParser:
+    """Recursive-descent parser producing nested tuples, collecting the cells and ranges read."""
+    def __init__(self, text):
+        self.tokens = _tokenize_formula(text)
+        self.pos = 0
+        self.refs = []
+        self.ranges = []
+
+    def parse(self):
+        node = self.comparison()
+        if self.pos != len(self.tokens): raise FormulaError("#ERROR!")
+        return node
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value): raise FormulaError("#ERROR!")
+        self.pos += 1
+        return kind, text
+
+    def binary(self, operand, operators):
+        node = operand()
+        while self.peek()[0] == "op" and self.peek()[1] in operators:
+            op = self.take()[1]
+            node = ("bin", op, node, operand())
+        return node
+
+    def comparison(self): return self.binary(self.concat, ("=", "<>", "<", ">", "<=", ">="))
+    def concat(self): return self.binary(self.additive, ("&",))
+    def additive(self): return self.binary(self.term, ("+", "-"))
+    def term(self): return self.binary(self.power, ("*", "/"))
+    def power(self): return self.binary(self.unary, ("^",))
+
+    def unary(self):
+        if self.peek() in (("op", "-"), ("op", "+")):
+            op = self.take()[1]
+            operand = self.unary()
+            return ("neg", operand) if op == "-" else ("pos", operand)
+        node = self.primary()
+        while self.peek() == ("op", "%"):
+            self.take()
+            node = ("pct", node)
+        return node
+
+    def primary(self):
+        kind, text = self.take()
+        if kind == "number":
+            return ("const", float(text))
+        if kind == "string":
+            return ("const", text[1:-1].replace('""', '"'))
+        if kind == "ref":
+            cell = _parse_cell_ref(text)
+            self.refs.append(cell)
+            return ("ref", cell)
+        if kind == "range":
+            (r0, c0), (r1, c1) = (_parse_cell_ref(part) for part in text.split(":"))
+            if r0 is None: r0, r1 = 0, None # Whole columns (A:A) stop at the last data row.
+            bounds = (min(r0, r1) if r1 is not None else r0, min(c0, c1),
+                      max(r0, r1) if r1 is not None else None, max(c0, c1))
+            self.ranges.append(bounds)
+            return ("range", bounds)
+        if kind == "name":
+            name = text.upper()
+            if self.peek() == ("op", "("):
+                self.take("(")
+                args = []
+                if self.peek() != ("op", ")"):
+                    args.append(self.comparison())
+                    while self.peek() == ("op", ","):
+                        self.take()
+                        args.append(self.comparison())
+                self.take(")")
+                return ("call", name, args)
+            if name in ("TRUE", "FALSE"):
+                return ("const", name == "TRUE")
+            raise FormulaError("#REF!" if self.peek() == ("op", "!") else "#NAME?")
+        if (kind, text) == ("op", "("):
+            node = self.comparison()
+            self.take(")")
+            return node
+        # Other sheets (Sheet2!A1) and anything else are not supported.
+        raise FormulaError("#REF!" if text == "!" else "#ERROR!")
+
+def _to_formula_number(value):
+    if value is None: return 0.0
+    if isinstance(value, list): raise FormulaError("#VALUE!") # A range where one value is needed
+    if isinstance(value, bool): return float(value)
+    if isinstance(value, float): return value
+    if _NUMBER_TEXT.match(value): return float(value)
+    raise FormulaError("#VALUE!")
+
+def _to_formula_text(value):
+    if value is None: return ""
+    if isinstance(value, bool): return "TRUE" if value else "FALSE"
+    if isinstance(value, float): return _format_number(value)
+    return value
+
+def _to_formula_bool(value):
+    if isinstance(value, list): raise FormulaError("#VALUE!")
+    if isinstance(value, str) and value.upper() in ("TRUE", "FALSE"): return value.upper() == "TRUE"
+    return _to_formula_number(value) != 0
+
+def _compare(op, a, b):
+    # Numbers sort before text, text compares case-insensitively, blanks act as 0 or "".
+    def key(v):
+        if v is None: return (0, 0.0)
+        if isinstance(v, bool): return (2, v)
+        if isinstance(v, float): return (0, v)
+        return (1, v.lower())
+    if a is None and isinstance(b, str): a = ""
+    if b is None and isinstance(a, str): b = ""
+    ka, kb = key(a), key(b)
+    return {"=": ka == kb, "<>": ka != kb, "<": ka < kb, ">": ka > kb, "<=": ka <= kb, ">=": ka >= kb}[op]
+
+def _criteria_matcher(criteria):
+    """Builds the test used by SUMIF/COUNTIF for criteria like '>5', '<>x' or 'apple'."""
+    text = _to_formula_text(criteria)
+    for op in ("<=", ">=", "<>", "<", ">", "="):
+        if text.startswith(op):
+            text = text[len(op):]
+            break
+    else:
+        op = "="
+    target = float(text) if _NUMBER_TEXT.match(text) else text
+    def matches(value):
+        if value is None or isinstance(value, FormulaError): return False
+        if isinstance(target, float) and not isinstance(value, float): return op == "<>"
+        return _compare(op, value, target)
+    return matches
+
+def _numbers(values):
+    # Range arguments skip text and blanks, like Excel's aggregate functions.
+    for v in values:
+        if isinstance(v, FormulaError): raise v
+    return [v for v in values if isinstance(v, float)]
+
+def _formula_function(name, args):
+    """Applies a spreadsheet function to evaluated arguments (ranges arrive as lists)."""
+    def flat():
+        for arg in args:
+            if isinstance(arg, list):
+                for v in arg:
+                    if isinstance(v, FormulaError): raise v
+                    yield v
+            else:
+                yield arg
+    def numbers():
+        result = []
+        for arg in args:
+            if isinstance(arg, list):
+                result.extend(_numbers(arg))
+            else:
+                result.append(_to_formula_number(arg))
+        return result
+    def scalar(i):
+        if i >= len(args): raise FormulaError("#VALUE!")
+        if isinstance(args[i], list): raise FormulaError("#VALUE!")
+        return args[i]
+
+    if name == "SUM": return float(sum(numbers()))
+    if name == "PRODUCT":
+        product = 1.0
+        for n in numbers(): product *= n
+        return product
+    if name in ("AVERAGE", "MIN", "MAX"):
+        values = numbers()
+        if not values: 
+            if name == "AVERAGE": raise FormulaError("#DIV/0!")
+            return 0.0
+        return sum(values) / len(values) if name == "AVERAGE" else (min if name == "MIN" else max)(values)
+    if name == "COUNT":
+        return float(sum(sum(isinstance(v, float) for v in arg) if isinstance(arg, list)
+                         else isinstance(arg, float) or (isinstance(arg, str) and bool(_NUMBER_TEXT.match(arg)))
+                         for arg in args))
+    if name == "COUNTA": return float(sum(1 for v in flat() if v not in (None, "")))
+    if name in ("AND", "OR"):
+        values = [_to_formula_bool(v) for v in flat() if v not in (None, "")]
+        return all(values) if name == "AND" else any(values)
+    if name == "NOT": return not _to_formula_bool(scalar(0))
+    if name == "ABS": return abs(_to_formula_number(scalar(0)))
+    if name == "ROUND":
+        digits = int(_to_formula_number(scalar(1))) if len(args) > 1 else 0
+        return float(round(_to_formula_number(scalar(0)), digits))
+    if name in ("CONCATENATE", "CONCAT"): return "".join(_to_formula_text(v) for v in flat())
+    if name == "LEN": return float(len(_to_formula_text(scalar(0))))
+    if name == "UPPER": return _to_formula_text(scalar(0)).upper()
+    if name == "LOWER": return _to_formula_text(scalar(0)).lower()
+    if name == "TRIM": return " ".join(_to_formula_text(scalar(0)).split())
+    if name in ("LEFT", "RIGHT"):
+        count = int(_to_formula_number(scalar(1))) if len(args) > 1 else 1
+        text = _to_formula_text(scalar(0))
+        return text[:count] if name == "LEFT" else (text[-count:] if count else "")
+    if name in ("SUMIF", "COUNTIF"):
+        if not isinstance(args[0], list): raise FormulaError("#VALUE!")
+        matches = _criteria_matcher(scalar(1))
+        hits = [i for i, v in enumerate(args[0]) if matches(v)]
+        if name == "COUNTIF": return float(len(hits))
+        sum_range = args[2] if len(args) > 2 and isinstance(args[2], list) else args[0]
+        return float(sum(_numbers([sum_range[i] for i in hits if i < len(sum_range)])))
+    raise FormulaError("#NAME?")
+
+def _excel_value(text):
+    """Converts numeric cell text back to a number for writing to a workbook."""
+    # Leading zeros (zip codes, IDs) stay text.
+    if isinstance(text, str) and _NUMBER_TEXT.match(text) and not re.match(r"\s*[+-]?0\d", text):
+        number = float(text)
+        return int(number) if number.is_integer() and "." not in text and "e" not in text.lower() else number
+    return text
+
+class FormulaEngine:
+    """Keeps the formulas of a sheet with a dependency graph and cached results.
+
+    Results are computed lazily when a cell is displayed. Changing a cell through
+    set_cell() invalidates only the formulas that (transitively) read it.
+    """
+    def __init__(self, rows, headers):
+        self.rows = rows
+        self.headers = headers
+        self.formulas = {}       # (row, col) -> (tree, refs, ranges)
+        self.readers = {}        # (row, col) -> formula cells referencing it directly
+        self.range_readers = {}  # formula cell -> ranges it reads
+        self.values = {}         # formula cell -> computed value or FormulaError
+        for r, row in enumerate(rows):
+            for c, raw in enumerate(row):
+                if isinstance(raw, str) and raw.startswith("=") and len(raw) > 1:
+                    self._register((r, c), raw)
+
+    def _register(self, cell, raw):
+        parser = None
+        try:
+            parser = _FormulaParser(raw[1:])
+            tree = parser.parse()
+        except FormulaError as e:
+            tree = ("error", e.code)
+        refs = parser.refs if parser else []
+        ranges = parser.ranges if parser else []
+        self.formulas[cell] = (tree, refs, ranges)
+        for ref in refs:
+            self.readers.setdefault(ref, set()).add(cell)
+        if ranges:
+            self.range_readers[cell] = ranges
+
+    def _unregister(self, cell):
+        entry = self.formulas.pop(cell, None)
+        if entry is None: return
+        for ref in entry[1]:
+            self.readers.get(ref, set()).discard(cell)
+        self.range_readers.pop(cell, None)
+
+    def _in_range(self, cell, bounds):
+        r0, c0, r1, c1 = bounds
+        return r0 <= cell[0] <= (r1 if r1 is not None else len(self.rows) - 1) and c0 <= cell[1] <= c1
+
+    def _inputs(self, cell):
+        """Formula cells that `cell`'s formula reads."""
+        _, refs, ranges = self.formulas[cell]
+        inputs = [ref for ref in refs if ref in self.formulas]
+        for bounds in ranges:
+            r0, c0, r1, c1 = bounds
+            r1 = min(r1 if r1 is not None else len(self.rows) - 1, len(self.rows) - 1)
+            if (r1 - r0 + 1) * (c1 - c0 + 1) <= len(self.formulas):
+                inputs.extend((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if (r, c) in self.formulas)
+            else:
+                inputs.extend(f for f in self.formulas if self._in_range(f, bounds))
+        return inputs
+
+    def _dependents(self, cell):
+        """Formula cells that read `cell` directly."""
+        found = set(self.readers.get(cell, ()))
+        found.update(f for f, ranges in self.range_readers.items() if any(self._in_range(cell, b) for b in ranges))
+        return found
+
+    def value(self, cell):
+        """Returns the value of a cell, evaluating stale formulas it depends on first.
+        Uses an explicit stack so long dependency chains do not hit the recursion limit."""
+        if cell not in self.formulas: return self._constant(cell)
+        stack, pending = [cell], set()
+        while stack:
+            top = stack[-1]
+            if top in self.values:
+                stack.pop()
+            elif top in pending:
+                stack.pop()
+                pending.discard(top)
+                self.values[top] = self._evaluate(top)
+            else:
+                pending.add(top)
+                stack.extend(i for i in self._inputs(top) if i not in self.values and i not in pending)
+        return self.values[cell]
+
+    def display(self, row_index, col_index):
+        value = self.value((row_index, col_index))
+        if isinstance(value, FormulaError): return value.code
+        return _to_formula_text(0.0 if value is None else value)
+
+    def set_cell(self, row_index, col_index, raw):
+        """Updates one cell and invalidates every formula depending on it.
+        Returns the row indices whose displayed values may have changed."""
+        cell = (row_index, col_index)
+        self._unregister(cell)
+        self.values.pop(cell, None)
+        if isinstance(raw, str) and raw.startswith("=") and len(raw) > 1:
+            self._register(cell, raw)
+        changed, queue = {cell}, deque([cell])
+        while queue:
+            for dependent in self._dependents(queue.popleft()):
+                if dependent not in changed:
+                    changed.add(dependent)
+                    self.values.pop(dependent, None)
+                    queue.append(dependent)
+        return {r for r, _ in changed}
+
+    def _constant(self, cell):
+        r, c = cell
+        if r == -1:
+            text = self.headers[c] if 0 <= c < len(self.headers) else ""
+        elif 0 <= r < len(self.rows) and 0 <= c < len(self.rows[r]):
+            text = self.rows[r][c]
+        else:
+            return None
+        if text == "" or text is None: return None
+        if _NUMBER_TEXT.match(text): return float(text)
+        if text.upper() in ("TRUE", "FALSE"): return text.upper() == "TRUE"
+        return text
+
+    def _read(self, cell):
+        if cell in self.formulas:
+            # A formula still being evaluated further up the stack means a circular reference.
+            value = self.values.get(cell, FormulaError("#CYCLE!"))
+        else:
+            value = self._constant(cell)
+        if isinstance(value, FormulaError): raise value
+        return value
+
+    def _range_values(self, bounds):
+        r0, c0, r1, c1 = bounds
+        r1 = min(r1 if r1 is not None else len(self.rows) - 1, len(self.rows) - 1)
+        values = []
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                cell = (r, c)
+                values.append(self.values.get(cell, FormulaError("#CYCLE!")) if cell in self.formulas else self._constant(cell))
+        return values
+
+    def _evaluate(self, cell):
+        try:
+            value = self._eval(self.formulas[cell][0])
+            if isinstance(value, list): raise FormulaError("#VALUE!")
+            return value
+        except FormulaError as e:
+            return e
+        except ZeroDivisionError:
+            return FormulaError("#DIV/0!")
+        except (ValueError, OverflowError, IndexError, TypeError, RecursionError):
+            return FormulaError("#NUM!")
+
+    def _eval(self, node):
+        kind = node[0]
+        if kind == "const": return node[1]
+        if kind == "ref": return self._read(node[1])
+        if kind == "range": return self._range_values(node[1])
+        if kind == "error": raise FormulaError(node[1])
+        if kind == "neg": return -_to_formula_number(self._eval(node[1]))
+        if kind == "pos": return _to_formula_number(self._eval(node[1]))
+        if kind == "pct": return _to_formula_number(self._eval(node[1])) / 100
+        if kind == "bin":
+            _, op, left, right = node
+            a, b = self._eval(left), self._eval(right)
+            if isinstance(a, list) or isinstance(b, list): raise FormulaError("#VALUE!")
+            if op == "&": return _to_formula_text(a) + _to_formula_text(b)
+            if op in ("=", "<>", "<", ">", "<=", ">="): return _compare(op, a, b)
+            a, b = _to_formula_number(a), _to_formula_number(b)
+            if op == "+": return a + b
+            if op == "-": return a - b
+            if op == "*": return a * b
+            if op == "/":
+                if b == 0: raise FormulaError("#DIV/0!")
+                return a / b
+            if a == 0 and b < 0: raise FormulaError("#DIV/0!")
+            result = a ** b
+            if isinstance(result, complex): raise FormulaError("#NUM!") # e.g. a fractional power of a negative number
+            return float(result)
+        # Function calls; IF and IFERROR only evaluate the branch they need.
+        _, name, args = node
+        if name == "IF":
+            if not 1 < len(args) <= 3: raise FormulaError("#VALUE!")
+            if _to_formula_bool(self._eval(args[0])): return self._eval(args[1])
+            return self._eval(args[2]) if len(args) == 3 else False
+        if name == "IFERROR":
+            if len(args) != 2: raise FormulaError("#VALUE!")
+            try:
+                return self._eval(args[0])
+            except FormulaError:
+                return self._eval(args[1])
+        return _formula_function(name, [self._eval(arg) for arg in args])
+
+# --- Operation Journal ---
+class OperationJournal:
+    """Append-only log of edits kept next to a document until it is saved.
+
+    The first line is a JSON header describing the file the edits apply to;
+    each following line is the JSON list of operations of one undo step, or a
+    [["sheet", name]] marker when the edits that follow belong to another sheet.
+    """
+    def __init__(self, doc_path, sheet, resume=False):
+        self.path = self.path_for(doc_path)
+        stat = os.stat(doc_path)
+        self.header = {"sheet": sheet, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        self.pending = []
+        self.created = resume and os.path.exists(self.path)
+
+    @staticmethod
+    def path_for(doc_path):
+        folder, name = os.path.split(os.path.abspath(doc_path))
+        return os.path.join(folder, f".{name}{JOURNAL_SUFFIX}")
+
+    @classmethod
+    def load(cls, doc_path):
+        """Returns (header, records) of a journal left next to doc_path, or None."""
+        path = cls.path_for(doc_path)
+        if not os.path.exists(path): return None
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None, []
+        records = []
+        for line in lines[1:]:
+            if not line: continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break # Torn write from the crash; everything before it is intact.
+        return header, records
+
+    @classmethod
+    def set_aside(cls, doc_path):
+        """Renames a journal that could not be replayed so a new journal does not overwrite it.
+        Returns its new path."""
+        path = cls.path_for(doc_path)
+        failed, n = f"{path}.failed", 2
+        while os.path.exists(failed):
+            failed = f"{path}.{n}.failed"
+            n += 1
+        os.replace(path, failed)
+        return failed
+
+    def append(self, ops):
+        """Buffers one undo step. Returns True once the buffer should be flushed."""
+        self.pending.append(json.dumps(ops, separators=(",", ":"), ensure_ascii=False))
+        return len(self.pending) >= JOURNAL_FLUSH_OPS
+
+    def flush(self):
+        if not self.pending: return
+        with open(self.path, "a" if self.created else "w", encoding="utf-8") as f:
+            if not self.created:
+                f.write(json.dumps(self.header) + "\n")
+            f.write("\n".join(self.pending) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.created = True
+        self.pending = []
+
+    def discard(self):
+        self.pending = []
+        self.created = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# --- Parsed File Cache ---
+class ParsedFileCache:
+    """On-disk cache of parsed sheet data, keyed by source path, size and mtime.
+
+    Entries are marshal-encoded so reopening an unchanged file skips the
+    XML/CSV parse entirely. Once the cache grows past `max_bytes` the least
+    recently used entries are evicted; entries larger than CACHE_MAX_ENTRY_FRACTION
+    of it are not stored at all.
+    """
+    def __init__(self, folder=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, file_path, key):
+        stat = os.stat(file_path)
+        ident = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{key}|{marshal.version}"
+        return os.path.join(self.folder, hashlib.sha1(ident.encode("utf-8")).hexdigest() + ".bin")
+
+    def get(self, file_path, key):
+        """Returns the cached value, or None if missing or the source has changed."""
+        try:
+            entry_path = self._entry_path(file_path, key)
+            with open(entry_path, "rb") as f:
+                value = marshal.load(f)
+            os.utime(entry_path) # Mark as recently used.
+            return value
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def put(self, file_path, key, value):
+        try:
+            data = marshal.dumps(value)
+            if len(data) > self.max_bytes * CACHE_MAX_ENTRY_FRACTION: return
+            os.makedirs(self.folder, exist_ok=True)
+            entry_path = self._entry_path(file_path, key)
+            tmp_path = entry_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, entry_path)
+            self._evict(keep=entry_path)
+        except (OSError, ValueError):
+            pass # The cache is only an accelerator; never fail a load because of it.
+
+    def _evict(self, keep=None):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(".bin"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if path == keep: continue # The entry just written stays.
+            os.remove(path)
+            total -= size
+
+# --- Out-of-Core Table Store ---
+class SqliteTableStore:
+    """Table data kept in a temporary SQLite database instead of in memory.
+
+    Column i is stored as c{i} and rowid is the original row order. The grid
+    pages through the current view (filter + sort) with LIMIT/OFFSET queries,
+    and sorting uses an index on the same sort key as _sort_rows.
+    """
+    def __init__(self, width):
+        import sqlite3
+        fd, self.path = tempfile.mkstemp(prefix="cells-", suffix=".sqlite")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.create_function("cells_sort_key", 1, _sort_value, deterministic=True)
+        self.width = max(1, width)
+        self.columns = [f"c{i}" for i in range(self.width)]
+        self.conn.execute(f"CREATE TABLE cells ({', '.join(self.columns)})")
+        self.order_sql = "rowid"
+        self.where_sql = ""
+        self.where_params = []
+        self._total = 0
+        self._count = 0
+
+    def _widen(self, width):
+        """Adds columns so rows with cells beyond the last header keep them (as the in-memory table does)."""
+        for i in range(self.width, width):
+            self.conn.execute(f"ALTER TABLE cells ADD COLUMN c{i} DEFAULT ''")
+            self.columns.append(f"c{i}")
+        self.width = width
+
+    def load(self, rows, progress=None):
+        """Bulk-inserts rows (short ones padded to the table width) in batches; a longer
+        row widens the table."""
+        insert_sql = f"INSERT INTO cells VALUES ({', '.join('?' * self.width)})"
+        pad = [""] * self.width
+        batch = []
+        for row in rows:
+            if len(row) > self.width:
+                if batch:
+                    self.conn.executemany(insert_sql, batch)
+                    self._total += len(batch)
+                    batch = []
+                self._widen(len(row))
+                insert_sql = f"INSERT INTO cells VALUES ({', '.join('?' * self.width)})"
+                pad = [""] * self.width
+            batch.append((list(row) + pad)[:self.width] if len(row) != self.width else row)
+            if len(batch) >= STORE_BATCH_ROWS:
+                self.conn.executemany(insert_sql, batch)
+                self._total += len(batch)
+                batch = []
+                if progress: progress(self._total)
+        if batch:
+            self.conn.executemany(insert_sql, batch)
+            self._total += len(batch)
+        self.conn.commit()
+        self._count = self._total
+
+    def total(self):
+        return self._total
+
+    def count(self):
+        """Number of rows in the current (filtered) view."""
+        return self._count
+
+    def set_filter(self, col_index=None, values=None):
+        """Keeps rows where column col_index (any column if None) contains one of
+        `values`, case-insensitively. values=None clears the filter; an empty list
+        matches no rows, like the in-memory search."""
+        if values is None:
+            self.where_sql, self.where_params = "", []
+            self._count = self._total
+            return
+        if not values:
+            self.where_sql, self.where_params = "WHERE 0", []
+            self._count = 0
+            return
+        columns = [self.columns[col_index]] if col_index is not None else self.columns
+        terms, params = [], []
+        for column in columns:
+            for value in values:
+                terms.append(f"{column} LIKE ? ESCAPE '\\'")
+                escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params.append(f"%{escaped}%")
+        self.where_sql = "WHERE " + " OR ".join(terms)
+        self.where_params = params
+        self._count = self.conn.execute(f"SELECT COUNT(*) FROM cells {self.where_sql}", params).fetchone()[0]
+
+    def set_order(self, col_index, reverse):
+        column = self.columns[col_index]
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{column} ON cells(cells_sort_key({column}))")
+        direction = "DESC" if reverse else "ASC"
+        self.order_sql = f"cells_sort_key({column}) {direction}, rowid {direction}"
+
+    def page(self, offset, limit):
+        """Returns [(rowid, row)] for one page of the current view."""
+        cursor = self.conn.execute(
+            f"SELECT rowid, * FROM cells {self.where_sql} ORDER BY {self.order_sql} LIMIT ? OFFSET ?",
+            self.where_params + [limit, offset])
+        return [(r[0], list(r[1:])) for r in cursor]
+
+    def get_row(self, rowid):
+        row = self.conn.execute("SELECT * FROM cells WHERE rowid = ?", (rowid,)).fetchone()
+        return list(row) if row else []
+
+    def update(self, rowid, col_index, value):
+        self.conn.execute(f"UPDATE cells SET {self.columns[col_index]} = ? WHERE rowid = ?", (value, rowid))
+        self.conn.commit()
+
+    def insert_blank(self):
+        cursor = self.conn.execute(f"INSERT INTO cells VALUES ({', '.join(['?'] * self.width)})", [""] * self.width)
+        self.conn.commit()
+        self._total += 1
+        self._count += 1
+        return cursor.lastrowid
+
+    def delete(self, rowid):
+        self.conn.execute("DELETE FROM cells WHERE rowid = ?", (rowid,))
+        self.conn.commit()
+        self._total -= 1
+        self._count -= 1
+
+    def iter_rows(self, filtered=False):
+        """Streams every row (or only those matching the filter) in the current sort order."""
+        where_sql, params = (self.where_sql, self.where_params) if filtered else ("", [])
+        for row in self.conn.execute(f"SELECT * FROM cells {where_sql} ORDER BY {self.order_sql}", params):
+            yield list(row)
+
+    def close(self):
+        self.conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# --- UI Update Scheduler ---
+class UIScheduler:
+    """Coalesces redraws: parts of the window are marked dirty and each is redrawn
+    once per idle cycle. Parts are drawn in registration order."""
+    def __init__(self, root):
+        self.root = root
+        self.handlers = {}
+        self.dirty = set()
+        self._after_id = None
+
+    def register(self, part, handler):
+        self.handlers[part] = handler
+
+    def mark(self, *parts):
+        self.dirty.update(parts)
+        if self._after_id is None:
+            self._after_id = self.root.after_idle(self.flush)
+
+    def flush(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        while self.dirty:
+            # A handler may mark other parts (a scroll marks the rows); later ones are drawn in this pass.
+            for part, handler in self.handlers.items():
+                if part in self.dirty:
+                    self.dirty.discard(part)
+                    handler()
+
+# --- Sheet Workspaces ---
+class SheetWorkspace:
+    """Editor state of one sheet (rows, undo history, sort, filter and scroll
+    position), kept while another sheet of the workbook is shown."""
+    FIELDS = ("data_rows", "headers", "view_rows", "history", "history_index", "current_sort_col",
+              "current_sort_reverse", "col_offset", "unsaved_changes", "formulas")
+
+    def __init__(self, editor):
+        for name in self.FIELDS:
+            setattr(self, name, getattr(editor, name))
+        query = editor.search_entry.get()
+        self.query = "" if query == "Search (e.g. key or Col:val1,val2)" else query
+
+    def activate(self, editor):
+        for name in self.FIELDS:
+            setattr(editor, name, getattr(self, name))
+
 # --- Tooltip Class (UNCHANGED) ---
 class Tooltip:
     def __init__(self, widget, text):
@@ -124,6 +1618,244 @@ class RenameSheetDialog(simpledialog.Dialog):
             self.result = None
             return
 
+# --- Column Picker Dialog ---
+class ColumnPickerDialog(simpledialog.Dialog):
+    def __init__(self, parent, title, prompt, columns, preselect_all=True):
+        self.prompt = prompt
+        self.columns = list(columns)
+        self.preselect_all = preselect_all
+        self.selected = None
+        super().__init__(parent, title=title)
+
+    def body(self, master):
+        tk.Label(master, text=self.prompt, justify=tk.LEFT).pack(pady=5)
+
+        list_frame = tk.Frame(master)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = tk.Scrollbar(list_frame, orient="vertical")
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(list_frame, selectmode=tk.MULTIPLE, exportselection=False,
+                                  height=min(15, max(3, len(self.columns))), width=40,
+                                  yscrollcommand=scrollbar.set)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.listbox.yview)
+        for name in self.columns:
+            self.listbox.insert(tk.END, name)
+        if self.preselect_all:
+            self.listbox.selection_set(0, tk.END)
+        return self.listbox
+
+    def apply(self):
+        self.selected = [self.columns[i] for i in self.listbox.curselection()]
+
+# --- Group By Dialog ---
+class GroupByDialog(simpledialog.Dialog):
+    def __init__(self, parent, columns):
+        self.columns = list(columns)
+        self.result = None
+        super().__init__(parent, title="Group By")
+
+    def body(self, master):
+        tk.Label(master, text="Group by column(s):").grid(row=0, column=0, columnspan=2, sticky="w", pady=(5, 0))
+        self.key_list = tk.Listbox(master, selectmode=tk.MULTIPLE, exportselection=False,
+                                   height=min(10, max(3, len(self.columns))), width=40)
+        self.key_list.grid(row=1, column=0, columnspan=2, sticky="nsew")
+        for name in self.columns:
+            self.key_list.insert(tk.END, name)
+
+        tk.Label(master, text="Aggregate column:").grid(row=2, column=0, sticky="w", pady=5)
+        self.value_combo = ttk.Combobox(master, state="readonly", values=["(rows only)"] + self.columns)
+        self.value_combo.current(0)
+        self.value_combo.grid(row=2, column=1, sticky="ew", pady=5)
+
+        agg_frame = tk.Frame(master)
+        agg_frame.grid(row=3, column=0, columnspan=2, sticky="w")
+        self.agg_vars = {}
+        for name in AGGREGATES:
+            var = tk.BooleanVar(value=name in ("count", "sum"))
+            tk.Checkbutton(agg_frame, text=name, variable=var).pack(side=tk.LEFT)
+            self.agg_vars[name] = var
+        return self.key_list
+
+    def validate(self):
+        if not self.key_list.curselection():
+            messagebox.showwarning("Group By", "Select at least one column to group by.", parent=self)
+            return False
+        if not any(var.get() for var in self.agg_vars.values()):
+            messagebox.showwarning("Group By", "Select at least one aggregate.", parent=self)
+            return False
+        return True
+
+    def apply(self):
+        value = self.value_combo.current()
+        self.result = (
+            list(self.key_list.curselection()),
+            value - 1 if value > 0 else None,
+            [name for name in AGGREGATES if self.agg_vars[name].get()],
+        )
+
+# --- Pivot Table Dialog ---
+class PivotDialog(simpledialog.Dialog):
+    def __init__(self, parent, columns):
+        self.columns = list(columns)
+        self.result = None
+        super().__init__(parent, title="Pivot Table")
+
+    def body(self, master):
+        self.combos = []
+        for row, (label, choices) in enumerate((
+                ("Row field:", self.columns),
+                ("Column field:", self.columns),
+                ("Value field:", ["(rows only)"] + self.columns),
+                ("Aggregate:", list(AGGREGATES)))):
+            tk.Label(master, text=label).grid(row=row, column=0, sticky="w", pady=2)
+            combo = ttk.Combobox(master, state="readonly", values=choices, width=30)
+            combo.current(min(row, 1) if row < 2 and len(self.columns) > 1 else 0)
+            combo.grid(row=row, column=1, sticky="ew", pady=2)
+            self.combos.append(combo)
+        return self.combos[0]
+
+    def validate(self):
+        if self.combos[0].current() == self.combos[1].current():
+            messagebox.showwarning("Pivot Table", "Pick different row and column fields.", parent=self)
+            return False
+        if self.combos[2].current() == 0 and self.combos[3].get() != "count":
+            messagebox.showwarning("Pivot Table", f"Pick a value field to {self.combos[3].get()}.", parent=self)
+            return False
+        return True
+
+    def apply(self):
+        value = self.combos[2].current()
+        self.result = (self.combos[0].current(), self.combos[1].current(),
+                       value - 1 if value > 0 else None, self.combos[3].get())
+
+# --- Merge (Join) Dialog ---
+class JoinDialog(simpledialog.Dialog):
+    """Picks the table to merge with, the key columns on both sides and the columns to add.
+
+    `sources` are the sheet names offered up front; `load_headers(source)` returns the
+    header row of a sheet name or file path.
+    """
+    def __init__(self, parent, columns, sources, load_headers, filetypes):
+        self.columns = list(columns)
+        self.sources = list(sources)
+        self.load_headers = load_headers
+        self.filetypes = filetypes
+        self.other_columns = []
+        self.result = None
+        super().__init__(parent, title="Merge With Sheet or File")
+
+    def body(self, master):
+        source_frame = tk.Frame(master)
+        source_frame.grid(row=0, column=0, columnspan=3, sticky="ew", pady=5)
+        tk.Label(source_frame, text="Merge with:").pack(side=tk.LEFT)
+        self.source_combo = ttk.Combobox(source_frame, state="readonly", values=self.sources, width=30)
+        self.source_combo.pack(side=tk.LEFT, padx=5)
+        self.source_combo.bind("<<ComboboxSelected>>", lambda e: self._load_source(self.source_combo.get()))
+        tk.Button(source_frame, text="File...", command=self._browse).pack(side=tk.LEFT)
+
+        def column_list(col, label):
+            tk.Label(master, text=label).grid(row=1, column=col, sticky="w")
+            listbox = tk.Listbox(master, selectmode=tk.MULTIPLE, exportselection=False, height=10, width=25)
+            listbox.grid(row=2, column=col, sticky="nsew", padx=2)
+            return listbox
+        self.left_keys = column_list(0, "Key column(s) here:")
+        self.right_keys = column_list(1, "Matching key column(s):")
+        self.right_cols = column_list(2, "Columns to add:")
+        for name in self.columns:
+            self.left_keys.insert(tk.END, name)
+
+        self.how = tk.StringVar(value="left")
+        how_frame = tk.Frame(master)
+        how_frame.grid(row=3, column=0, columnspan=3, sticky="w", pady=5)
+        tk.Radiobutton(how_frame, text="Left join (keep all rows)", variable=self.how, value="left").pack(side=tk.LEFT)
+        tk.Radiobutton(how_frame, text="Inner join (matching rows only)", variable=self.how, value="inner").pack(side=tk.LEFT)
+
+        if self.sources:
+            self.source_combo.current(0)
+            self._load_source(self.sources[0])
+        return self.source_combo
+
+    def _browse(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=self.filetypes)
+        if not path: return
+        self.source_combo.config(values=list(self.source_combo.cget("values")) + [path])
+        self.source_combo.set(path)
+        self._load_source(path)
+
+    def _load_source(self, source):
+        try:
+            self.other_columns = self.load_headers(source)
+        except Exception as e:
+            messagebox.showerror("Merge", f"Could not read {source}\n{e}", parent=self)
+            self.other_columns = []
+        for listbox in (self.right_keys, self.right_cols):
+            listbox.delete(0, tk.END)
+            for name in self.other_columns:
+                listbox.insert(tk.END, name)
+
+    def validate(self):
+        left, right = self.left_keys.curselection(), self.right_keys.curselection()
+        if not left or len(left) != len(right):
+            messagebox.showwarning("Merge", "Select the same number of key columns on both sides.", parent=self)
+            return False
+        if not self.right_cols.curselection():
+            messagebox.showwarning("Merge", "Select at least one column to add.", parent=self)
+            return False
+        return True
+
+    def apply(self):
+        self.result = (
+            self.source_combo.get(),
+            list(self.left_keys.curselection()),
+            list(self.right_keys.curselection()),
+            list(self.right_cols.curselection()),
+            self.how.get(),
+        )
+
+# --- Compare Dialog ---
+class CompareDialog(simpledialog.Dialog):
+    """Picks the table to compare against (another sheet or a file) and optional key columns."""
+    def __init__(self, parent, columns, sources, filetypes):
+        self.columns = list(columns)
+        self.sources = list(sources)
+        self.filetypes = filetypes
+        self.result = None
+        super().__init__(parent, title="Compare With Sheet or File")
+
+    def body(self, master):
+        source_frame = tk.Frame(master)
+        source_frame.pack(fill=tk.X, pady=5)
+        tk.Label(source_frame, text="Compare with:").pack(side=tk.LEFT)
+        self.source_combo = ttk.Combobox(source_frame, state="readonly", values=self.sources, width=30)
+        self.source_combo.pack(side=tk.LEFT, padx=5)
+        tk.Button(source_frame, text="File...", command=self._browse).pack(side=tk.LEFT)
+        if self.sources:
+            self.source_combo.current(0)
+
+        tk.Label(master, text="Match rows on key column(s)\n(none selected compares whole rows):", justify=tk.LEFT).pack(anchor="w")
+        self.key_list = tk.Listbox(master, selectmode=tk.MULTIPLE, exportselection=False,
+                                   height=min(10, max(3, len(self.columns))), width=40)
+        self.key_list.pack(fill=tk.BOTH, expand=True)
+        for name in self.columns:
+            self.key_list.insert(tk.END, name)
+        return self.source_combo
+
+    def _browse(self):
+        path = filedialog.askopenfilename(parent=self, filetypes=self.filetypes)
+        if not path: return
+        self.source_combo.config(values=list(self.source_combo.cget("values")) + [path])
+        self.source_combo.set(path)
+
+    def validate(self):
+        if not self.source_combo.get():
+            messagebox.showwarning("Compare", "Choose a sheet or file to compare with.", parent=self)
+            return False
+        return True
+
+    def apply(self):
+        self.result = (self.source_combo.get(), list(self.key_list.curselection()))
+
 # ---------------------------------------------
 
 class ExcelEditor:
@@ -145,15 +1877,50 @@ class ExcelEditor:
         self.root.protocol("WM_DELETE_WINDOW", self._on_close) 
 
         self.data_rows = []
+        self.headers = []
+        self.view_rows = [] # Indices into data_rows shown in the grid (filtered/unfiltered)
+        self._fresh_items = set() # Rows whose grid item shows the current column window and values
+        self.row_filter = None # Predicate of the active search filter, applied to appended rows
+        self.col_offset = 0 # First header bound to the grid's display columns
+        self.col_window = 0 # Number of display columns currently bound
+        self._heading_text = {}
+        self.store = None # SqliteTableStore when the table is opened out-of-core
+        self.row_offset = 0 # First view row shown when paging through the store
+        self._status_message = None # Pending status bar text (None shows the document summary)
+        self._edit_preview = None # (item id, values) typed into the cell editor, not yet drawn
+        # Comparison highlights keyed by id(row) so they follow rows through sorting and
+        # filtering; the row is kept in the value so its id cannot be reused.
+        self.diff_marks = {}
+        self.ui = UIScheduler(self.root)
+        self.ui.register("columns", self._apply_col_offset)
+        self.ui.register("page", self._apply_row_offset)
+        self.ui.register("rows", self._draw_visible_values)
+        self.ui.register("visible", self._draw_scrolled_values)
+        self.ui.register("headings", self._draw_headings)
+        self.ui.register("status", self._draw_status_bar)
+        self.ui.register("title", self._draw_title)
+        self.ui.register("edit_preview", self._draw_edit_preview)
         self.file_path = None
         self.file_type = None
         self.workbook = None 
+        self.workbook_path = None # Source of the workbook when it is loaded lazily
+        self.csv_format = dict(DEFAULT_CSV_FORMAT) # Encoding/dialect of the open delimited file
+        self.columnar_schema = None # pyarrow schema of the open Parquet/Feather file
+        self.projected_from = None # Parquet/Feather file of which only some columns were loaded
+        self.parse_cache = ParsedFileCache()
         self.sheet_names = [] 
         self.current_sheet = None 
         self.unsaved_changes = False
         self.history = deque(maxlen=50) 
+        self.workspaces = {} # sheet name -> SheetWorkspace of the sheets not currently shown
+        self.pivot_source = None # (source editor, pivot settings) when this window shows a pivot table
+        self.follow_offset = None # End of the last complete line read from the open delimited file (uncompressed files only)
+        self.follow_partial = None # Row parsed from an incomplete last line, completed by follow mode
+        self._follow_id = None
         self.history_index = -1
         self.is_undoing = False
+        self.journal = None
+        self._journal_flush_id = None
         
         self.selected_row_index = None 
         self.selected_col_index = None 
@@ -164,6 +1931,9 @@ class ExcelEditor:
         self.current_sort_reverse = False
         
         self.show_grid = tk.BooleanVar(value=True) 
+        self.formula_mode = tk.BooleanVar(value=False)
+        self.follow_mode = tk.BooleanVar(value=False)
+        self.formulas = None # FormulaEngine for the current sheet while formula mode is on
 
         self._configure_styles()
         self._create_menu_bar()
@@ -255,9 +2025,12 @@ class ExcelEditor:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="New Sheet", command=self.create_new_sheet)
         file_menu.add_command(label="Open...", command=self.open_file)
+        file_menu.add_command(label="Open Large File (Out-of-Core)...", command=lambda: self.open_file(out_of_core=True))
         file_menu.add_separator()
         file_menu.add_command(label="Save", command=self.save_file)
         file_menu.add_command(label="Save As...", command=self.save_as_file)
+        file_menu.add_command(label="Export Current View...", command=self.export_view)
+        file_menu.add_command(label="Export Selected Rows...", command=lambda: self.export_view(selection_only=True))
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self._on_close)
 
@@ -274,17 +2047,36 @@ class ExcelEditor:
         edit_menu.add_command(label="📋 Paste Vertical (into Column)", command=self.paste_vertical) 
         edit_menu.add_command(label="➡️ Paste Horizontal (into Row)", command=self.paste_horizontal) 
 
+        # --- Data Menu ---
+        data_menu = tk.Menu(menubar, tearoff=0, bg=self.bg_color, fg=self.fg_color)
+        menubar.add_cascade(label="Data", menu=data_menu)
+        data_menu.add_command(label="Remove Duplicate Rows...", command=self.remove_duplicates)
+        data_menu.add_command(label="Group By...", command=self.group_by)
+        data_menu.add_command(label="Pivot Table...", command=self.pivot_table)
+        data_menu.add_command(label="Refresh Pivot Table", command=self.refresh_pivot)
+        data_menu.add_command(label="Merge With Sheet or File...", command=self.merge_table)
+        data_menu.add_separator()
+        data_menu.add_command(label="Compare With Sheet or File...", command=self.compare_table)
+        data_menu.add_command(label="Clear Comparison Highlights", command=self.clear_diff_highlights)
+
         # --- View Menu ---
         view_menu = tk.Menu(menubar, tearoff=0, bg=self.bg_color, fg=self.fg_color)
         menubar.add_cascade(label="View", menu=view_menu)
         view_menu.add_checkbutton(label="Show Grid Lines", 
                                   variable=self.show_grid, 
                                   command=self.toggle_grid_lines)
+        view_menu.add_checkbutton(label="Formula Mode (keep and evaluate formulas)",
+                                  variable=self.formula_mode,
+                                  command=self.toggle_formula_mode)
+        view_menu.add_checkbutton(label="Follow File (show rows appended to the CSV)",
+                                  variable=self.follow_mode,
+                                  command=self.toggle_follow)
 
         # --- NEW: Help Menu ---
         help_menu = tk.Menu(menubar, tearoff=0, bg=self.bg_color, fg=self.fg_color)
         menubar.add_cascade(label="Help", menu=help_menu)
         help_menu.add_command(label="Documentation", command=self.show_documentation)
+        help_menu.add_command(label="Memory Diagnostics...", command=self.show_memory_diagnostics)
         help_menu.add_command(label="About", command=self.show_about)
 
 
@@ -354,10 +2146,25 @@ class ExcelEditor:
         self.hsb = tk.Scrollbar(self.frame, orient="horizontal")
         self.hsb.pack(side=tk.BOTTOM, fill=tk.X)
 
-        self.tree = ttk.Treeview(self.frame, yscrollcommand=self.vsb.set, xscrollcommand=self.hsb.set)
+        # Only the columns in view are bound to the Treeview; the horizontal
+        # scrollbar moves that window across self.headers (see _xview). Out-of-core
+        # tables page rows the same way through the vertical scrollbar (see _yview).
+        self.tree = ttk.Treeview(self.frame, yscrollcommand=self._on_tree_yscroll)
         self.tree.pack(fill=tk.BOTH, expand=True)
-        self.vsb.config(command=self.tree.yview)
-        self.hsb.config(command=self.tree.xview)
+        for tag, color in DIFF_COLORS.items():
+            self.tree.tag_configure(tag, background=color)
+        self.vsb.config(command=self._yview)
+        self.hsb.config(command=self._xview)
+        self.hsb.set(0, 1)
+        
+        self.tree.bind("<MouseWheel>", lambda e: self._on_mouse_wheel(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self._on_mouse_wheel(-1))
+        self.tree.bind("<Button-5>", lambda e: self._on_mouse_wheel(1))
+        
+        self.tree.bind("<Configure>", self._on_tree_resize)
+        self.tree.bind("<Shift-MouseWheel>", lambda e: self._xview("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Shift-Button-4>", lambda e: self._xview("scroll", -1, "units"))
+        self.tree.bind("<Shift-Button-5>", lambda e: self._xview("scroll", 1, "units"))
         
         self.tree.bind("<Button-3>", self.show_context_menu)
         self.tree.bind("<Double-1>", self.edit_cell, add="+")
@@ -396,15 +2203,23 @@ class ExcelEditor:
         self.menu.add_separator()
         self.menu.add_command(label="Search (from search box)", command=self.apply_search_filter)
 
-    # ---------------- State Management / Undo/Redo (UNCHANGED) ----------------
-    def _save_state(self):
+    # ---------------- State Management / Undo/Redo ----------------
+    def _save_state(self, *ops):
+        """Records an undo step. `ops` describe the edit for the journal; without
+        them the whole table is journaled as a reset."""
         if self.is_undoing: return
+        if self.store is not None:
+            # Out-of-core tables are too large to snapshot; edits go straight to the database.
+            self.unsaved_changes = True
+            self._update_status_bar()
+            return
         if self.history_index < len(self.history) - 1:
             while len(self.history) > self.history_index + 1:
                 self.history.pop()
-        current_state = ([list(row) for row in self.data_rows], list(self.tree["columns"]))
+        current_state = ([list(row) for row in self.data_rows], list(self.headers))
         self.history.append(current_state)
         self.history_index = len(self.history) - 1
+        self._journal_ops(ops or [("reset", current_state[1], current_state[0])])
         self.unsaved_changes = True
         self._update_status_bar()
 
@@ -412,188 +2227,700 @@ class ExcelEditor:
         if index < 0 or index >= len(self.history): return
         self.is_undoing = True
         self.history_index = index
-        self.data_rows, columns = self.history[index]
-        self.tree["columns"] = columns
-        self._refresh_headings()
+        rows, columns = self.history[index]
+        # Work on a copy so later edits cannot rewrite the snapshot (journal replay relies on it).
+        self.data_rows = [list(row) for row in rows]
+        self._set_headers(columns)
         self.clear_filter() 
         self.is_undoing = False
+        self._journal_ops([("goto", index)])
         self.unsaved_changes = (index != len(self.history) - 1)
         self._update_status_bar()
 
+    def _apply_ops(self, *ops):
+        """Applies edit operations to the data model, refreshing headings if columns changed."""
+        headers = list(self.headers)
+        for op in ops:
+            _apply_op(self.data_rows, headers, op)
+        if headers != self.headers:
+            self._set_headers(headers)
+        engine = self.formulas if self.formulas is not None and self.formulas.rows is self.data_rows else None
+        if engine is None: return
+        if all(op[0] == "set" for op in ops):
+            # Only the edited cells and the formulas depending on them are recalculated.
+            changed = set()
+            for _, row_index, col_index, value in ops:
+                changed |= engine.set_cell(row_index, col_index, value)
+            for row_index in changed:
+                self._refresh_item(row_index)
+        else:
+            self.formulas = None # Rebuilt from the new layout on next display.
+
     def undo(self):
+        if not self._require_in_memory("Undo"): return
         if self.history_index > 0:
             self._load_state(self.history_index - 1)
         
     def redo(self):
+        if not self._require_in_memory("Redo"): return
         if self.history_index < len(self.history) - 1:
             self._load_state(self.history_index + 1)
             
     # ---------------- Status Bar / Exit (UNCHANGED) ----------------
     def _update_status_bar(self, message=None):
+        """Shows `message` (or the document summary) on the next idle cycle; the last call wins."""
+        self._status_message = message
         if message:
-            self.status_bar.config(text=message)
+            self.ui.mark("status")
+        else:
+            self.ui.mark("status", "title")
+
+    def _draw_status_bar(self):
+        if self._status_message:
+            self.status_bar.config(text=self._status_message)
             return
-        file_path = self.file_path if self.file_path is not None else '' 
-        file_name = os.path.basename(file_path)
-        file_name = file_name if file_name else 'None'
+        file_name = os.path.basename(self.file_path) if self.file_path else 'None'
         sheet_info = f" | Sheet: {self.current_sheet}" if self.current_sheet else ""
-        row_count = len(self.data_rows)
-        col_count = len(self.tree["columns"]) if self.tree["columns"] else 0
+        row_count = self.store.total() if self.store is not None else len(self.data_rows)
+        col_count = len(self.headers)
         status_text = f"File: {file_name}{sheet_info} | Rows: {row_count} | Columns: {col_count}"
+        if self.store is not None:
+            status_text += " | Out-of-core (SQLite)"
+        elif self.formula_mode.get():
+            status_text += " | Formula mode"
+        dirty = self._dirty_sheets()
+        if dirty:
+            status_text += " | **UNSAVED CHANGES**"
+            if dirty != [self.current_sheet]:
+                status_text += f" in {', '.join(dirty)}"
+        self.status_bar.config(text=status_text)
+
+    def _draw_title(self):
         window_title = "Excel/CSV Editor"
-        if file_name and file_name != 'None':
-            window_title += f" - {file_name}"
+        if self.file_path:
+            window_title += f" - {os.path.basename(self.file_path)}"
         if self.current_sheet:
             window_title += f" ({self.current_sheet})"
-        if self.unsaved_changes:
-            status_text += " | **UNSAVED CHANGES**"
+        if self._has_unsaved_changes():
             window_title += " *"
-        self.status_bar.config(text=status_text)
         self.root.title(window_title)
 
     def _on_close(self):
-        if self.unsaved_changes:
+        if self._has_unsaved_changes():
             response = messagebox.askyesnocancel("Unsaved Changes", 
                                                 "You have unsaved changes. Do you want to save before exiting?")
             if response is None: return
             elif response is True: 
                 self.save_file()
-                if self.unsaved_changes: return
+                if self._has_unsaved_changes(): return
+        self._discard_journal()
+        self._close_store()
+        self._stop_follow()
         self.root.destroy()
-        
-    # ---------------- File/Sheet Loading/Saving ----------------
-    def open_file(self):
-        if self.unsaved_changes:
-            if not messagebox.askyesno("Unsaved Changes", "Discard unsaved changes and open a new file?"):
-                return
-        file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls"), ("CSV files", "*.csv")])
-        if not file_path: return
-        self.file_path = file_path
-        self.unsaved_changes = False
-        self.workbook = None 
-        try:
-            if file_path.lower().endswith((".xlsx", ".xls")):
+
+    # ---------------- Crash Recovery Journal ----------------
+    def _start_journal(self, resume=False):
+        # Out-of-core edits are written straight to the database, which has no undo steps to journal.
+        if not self.file_path or not os.path.exists(self.file_path) or self.store is not None: return
+        self.journal = OperationJournal(self.file_path, self.current_sheet, resume=resume)
+
+    def _journal_ops(self, ops):
+        if self.journal is None: return
+        if self.journal.append(ops):
+            self._flush_journal()
+        elif self._journal_flush_id is None:
+            self._journal_flush_id = self.root.after(JOURNAL_FLUSH_MS, self._flush_journal)
+
+    def _flush_journal(self):
+        if self._journal_flush_id is not None:
+            self.root.after_cancel(self._journal_flush_id)
+            self._journal_flush_id = None
+        if self.journal is None: return
+        try:
+            self.journal.flush()
+        except OSError as e:
+            self.journal = None
+            self._update_status_bar(f"Crash recovery journal disabled: {e}")
+
+    def _discard_journal(self):
+        if self._journal_flush_id is not None:
+            self.root.after_cancel(self._journal_flush_id)
+            self._journal_flush_id = None
+        if self.journal is None: return
+        try:
+            self.journal.discard()
+        except OSError:
+            pass
+        self.journal = None
+
+    def _recover_from_journal(self):
+        """Offers to replay a journal left behind by an unclean exit. Returns True if replayed."""
+        loaded = OperationJournal.load(self.file_path)
+        if loaded is None: return False
+        if self.store is not None:
+            # Edits are replayed into data_rows, which an out-of-core table does not use.
+            # The journal stays on disk (out-of-core tables are not journaled) for the next in-memory open.
+            messagebox.showinfo("Recover Unsaved Changes",
+                                "Cells did not close cleanly last time and unsaved edits to this file can be "
+                                "recovered, but not in out-of-core mode.\n\nReopen the file in memory to recover them.")
+            return False
+        header, records = loaded
+        journal_path = OperationJournal.path_for(self.file_path)
+        # Split the journal into each sheet's undo steps; the last marker names the sheet that was shown.
+        # Sheets are tracked by their name in the file, since markers use the name at the time.
+        sheet = header.get("sheet") if header else None
+        per_sheet = {}
+        original = {} # current name -> name in the file, for renamed sheets
+        renames = []
+        for ops in records:
+            if ops and ops[0][0] == "sheet":
+                sheet = ops[0][1]
+            elif ops and ops[0][0] == "rename_sheet":
+                _, old, new = ops[0]
+                renames.append((old, new))
+                original[new] = original.pop(old, old)
+                if sheet == old: sheet = new
+            else:
+                per_sheet.setdefault(original.get(sheet, sheet), []).append(ops)
+        sheet = original.get(sheet, sheet)
+        edits = sum(len(steps) for steps in per_sheet.values()) + len(renames)
+        if not edits:
+            os.remove(journal_path)
+            return False
+        sheets = [name for name in per_sheet if name != sheet] + [sheet]
+        unknown = [name for name in sheets if name not in self.sheet_names] if self.file_type == "excel" else []
+        if unknown:
+            failed = OperationJournal.set_aside(self.file_path)
+            messagebox.showwarning("Recover Unsaved Changes",
+                                   f"Unsaved edits were found for sheet(s) no longer in this file: {', '.join(unknown)}.\n\n"
+                                   f"They cannot be replayed and were kept in {failed}")
+            return False
+
+        names = ", ".join(f"'{name}'" for name in per_sheet)
+        prompt = (f"Cells did not close cleanly last time. {edits} unsaved edit(s) "
+                  f"to sheet(s) {names} can be recovered.\n\nReplay them now?")
+        stat = os.stat(self.file_path)
+        if header.get("size") != stat.st_size or header.get("mtime") != stat.st_mtime_ns:
+            prompt += "\n\nWarning: the file has been modified since these edits were made."
+        if not messagebox.askyesno("Recover Unsaved Changes", prompt):
+            os.remove(journal_path)
+            return False
+
+        for name in sheets:
+            if name != self.current_sheet:
+                self._show_sheet(name)
+            if name not in per_sheet: continue
+            headers = list(self.headers)
+            try:
+                history, index = _replay_journal(per_sheet[name], [list(row) for row in self.data_rows], 
+                                                 headers, self.history.maxlen)
+            except (IndexError, KeyError, ValueError, TypeError) as e:
+                failed = OperationJournal.set_aside(self.file_path)
+                messagebox.showerror("Error", f"Failed to replay recovery journal\n{e}\n\n"
+                                     f"The unsaved edits were kept in {failed}")
+                return False
+
+            self.history = history
+            self.history_index = index
+            rows, columns = history[index]
+            self.data_rows = [list(row) for row in rows]
+            self._set_headers(columns)
+            self.clear_filter()
+            self.unsaved_changes = True
+        try:
+            for old, new in renames:
+                self._rename_sheet(old, new)
+        except (KeyError, ValueError) as e:
+            failed = OperationJournal.set_aside(self.file_path)
+            messagebox.showerror("Error", f"Failed to replay a sheet rename from the recovery journal\n{e}\n\n"
+                                 f"The unsaved edits were kept in {failed}")
+            return False
+        self._start_journal(resume=True)
+        self._update_status_bar(f"Recovered {edits} edit(s) from the crash recovery journal.")
+        return True
+        
+    # ---------------- File/Sheet Loading/Saving ----------------
+    def _file_dialog_types(self, saving=False):
+        filetypes = [("Excel files", "*.xlsx" if saving else "*.xlsx;*.xls"), ("CSV/TSV files", CSV_FILETYPES)]
+        if _pyarrow_available():
+            filetypes.append(("Parquet/Feather files", COLUMNAR_FILETYPES))
+        return filetypes
+
+    def open_file(self, file_path=None, columns=None, out_of_core=None):
+        """Opens file_path (or asks for one). `columns` limits which columns of a
+        Parquet/Feather file are read; `out_of_core` loads the table into a temporary
+        SQLite database (None asks for very large files). Returns True if the file was loaded."""
+        if self._has_unsaved_changes():
+            if not messagebox.askyesno("Unsaved Changes", "Discard unsaved changes and open a new file?"):
+                return False
+        if file_path is None:
+            file_path = filedialog.askopenfilename(filetypes=self._file_dialog_types())
+        if not file_path: return False
+        if out_of_core is None:
+            size = os.path.getsize(file_path)
+            out_of_core = size > OUT_OF_CORE_SUGGEST_BYTES and messagebox.askyesno(
+                "Large File", f"{os.path.basename(file_path)} is {size / 1024 ** 2:.0f} MB.\n\n"
+                "Open it out-of-core? Rows are kept in a temporary SQLite database instead of memory; "
+                "undo and column editing are not available in this mode.")
+        self._discard_journal()
+        self._close_store()
+        self.workspaces = {}
+        self.pivot_source = None
+        self._stop_follow()
+        self.file_path = file_path
+        self.unsaved_changes = False
+        self.workbook = None 
+        self.workbook_path = None
+        self.csv_format = dict(DEFAULT_CSV_FORMAT)
+        self.columnar_schema = None
+        self.projected_from = None
+        try:
+            if file_path.lower().endswith((".xlsx", ".xls")):
                 self.file_type = "excel"
-                self.workbook = load_workbook(filename=file_path, data_only=True)
-                self.sheet_names = self.workbook.sheetnames
+                self.workbook_path = file_path
+                self.sheet_names = self.parse_cache.get(file_path, "sheets")
+                if self.sheet_names is None and out_of_core:
+                    from openpyxl import load_workbook
+                    source = load_workbook(filename=file_path, read_only=True)
+                    self.sheet_names = source.sheetnames
+                    source.close()
+                elif self.sheet_names is None:
+                    self.sheet_names = self._ensure_workbook().sheetnames
+                    self.parse_cache.put(file_path, "sheets", self.sheet_names)
                 self.current_sheet = self.sheet_names[0]
                 self.sheet_selector.config(values=self.sheet_names)
                 self.sheet_selector.set(self.current_sheet)
-                self.read_excel_sheet(self.current_sheet)
-            elif file_path.lower().endswith(".csv"):
+                if out_of_core:
+                    self.read_into_store(file_path, self.current_sheet)
+                else:
+                    self.read_excel_sheet(self.current_sheet)
+            elif _is_delimited_path(file_path):
                 self.file_type = "csv"
                 self.workbook = None # CSV doesn't use openpyxl Workbook
                 self.sheet_names = ["Data"] 
                 self.current_sheet = "Data"
                 self.sheet_selector.config(values=self.sheet_names)
                 self.sheet_selector.set(self.current_sheet)
-                self.read_csv(file_path)
+                if out_of_core:
+                    self.csv_format = _sniff_csv_format(file_path)
+                    self.read_into_store(file_path)
+                else:
+                    self.read_csv(file_path)
+            elif _columnar_kind(file_path):
+                if not _pyarrow_available():
+                    raise RuntimeError("Parquet/Feather support requires pyarrow (pip install pyarrow).")
+                self.file_type = "columnar"
+                self.sheet_names = ["Data"] 
+                self.current_sheet = "Data"
+                self.sheet_selector.config(values=self.sheet_names)
+                self.sheet_selector.set(self.current_sheet)
+                if out_of_core:
+                    self.columnar_schema = _read_columnar_schema(file_path)
+                    self.read_into_store(file_path)
+                else:
+                    self.read_columnar(file_path, columns)
             self.history.clear()
             self.current_sort_col = None
             self.current_sort_reverse = False
             self._save_state()
             self.unsaved_changes = False 
             self._update_status_bar()
+            if not self._recover_from_journal():
+                self._start_journal()
+            return True
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open file\n{e}")
             self.file_path = None 
+            return False
+
+    def open_from_command_line(self, file_path, sheet=None, query=None, columns=None, out_of_core=None):
+        """Opens a file given on the command line, then selects `sheet` and applies the search `query`."""
+        if not os.path.isfile(file_path):
+            messagebox.showerror("Error", f"File not found:\n{file_path}")
+            return
+        if not self.open_file(file_path, columns=columns, out_of_core=out_of_core): return
+        if sheet and sheet != self.current_sheet:
+            if sheet in self.sheet_names:
+                self.sheet_selector.set(sheet)
+                self.switch_sheet(None)
+            else:
+                messagebox.showwarning("Warning", f"Sheet '{sheet}' not found in {os.path.basename(file_path)}.")
+        if query:
+            self._clear_placeholder(None)
+            self.search_entry.insert(0, query)
+            self.apply_search_filter()
+
+    def report_startup_time(self, budget_ms=STARTUP_BUDGET_MS):
+        """Shows the time from launch to the first drawn window; warns on stderr when over budget."""
+        self.root.update_idletasks()
+        elapsed_ms = (time.perf_counter() - _PROCESS_START) * 1000
+        message = f"Startup: {elapsed_ms:.0f} ms (budget {budget_ms:.0f} ms)"
+        if elapsed_ms > budget_ms:
+            print(f"Cells: {message} - over budget", file=sys.stderr)
+        self._update_status_bar(f"{self.status_bar.cget('text')} | {message}")
 
     def switch_sheet(self, event):
-        if self.file_type != "excel" or self.workbook is None: return
+        if self.file_type != "excel" or not self.sheet_names: return
         new_sheet_name = self.sheet_selector.get()
         if new_sheet_name == self.current_sheet: return
+        if self.store is None:
+            self._show_sheet(new_sheet_name)
+            self._update_status_bar()
+            return
+        # Out-of-core tables have a single database, so the sheet is reloaded into it.
         if self.unsaved_changes:
             if not messagebox.askyesno("Unsaved Changes", "Switching sheets will discard unsaved changes. Continue?"):
                 self.sheet_selector.set(self.current_sheet) 
                 return
         self.current_sheet = new_sheet_name
-        self.read_excel_sheet(self.current_sheet)
-        self.history.clear()
+        self.read_into_store(self.file_path, self.current_sheet)
         self.current_sort_col = None
         self.current_sort_reverse = False
-        self._save_state()
         self.unsaved_changes = False 
         self._update_status_bar()
 
+    def _show_sheet(self, sheet_name):
+        """Stashes the current sheet's workspace and shows `sheet_name`, parsing it only on its first visit."""
+        self.workspaces[self.current_sheet] = SheetWorkspace(self)
+        self.current_sheet = sheet_name
+        self.sheet_selector.set(sheet_name)
+        self.selected_row_index = self.selected_col_index = None
+        workspace = self.workspaces.pop(sheet_name, None)
+        if workspace is not None:
+            workspace.activate(self)
+            self._layout_columns()
+            self._render_rows()
+            self._set_search_text(workspace.query)
+        else:
+            self.current_sort_col = None
+            self.current_sort_reverse = False
+            self.col_offset = 0
+            self.unsaved_changes = False
+            self.read_excel_sheet(sheet_name)
+            self.history = deque([([list(row) for row in self.data_rows], list(self.headers))], maxlen=self.history.maxlen)
+            self.history_index = 0
+            self._set_search_text("")
+        self._journal_ops([("sheet", sheet_name)])
+
+    def _set_search_text(self, text):
+        self.search_entry.delete(0, tk.END)
+        if text:
+            self.search_entry.insert(0, text)
+            self.search_entry.config(fg=self.fg_color)
+        else:
+            self._restore_placeholder(None)
+
+    def _dirty_sheets(self):
+        dirty = [name for name, workspace in self.workspaces.items() if workspace.unsaved_changes]
+        if self.unsaved_changes:
+            dirty.append(self.current_sheet)
+        return dirty
+
+    def _has_unsaved_changes(self):
+        return bool(self._dirty_sheets())
+
+    def _ensure_workbook(self):
+        """Returns the openpyxl workbook, loading it on first use (sheets may come from the parse cache)."""
+        if self.workbook is None and self.workbook_path:
+            from openpyxl import load_workbook
+            # Formula mode keeps the formulas; otherwise openpyxl returns the values cached by Excel.
+            self.workbook = load_workbook(filename=self.workbook_path, data_only=not self.formula_mode.get())
+        return self.workbook
+
     def read_excel_sheet(self, sheet_name):
-        sheet = self.workbook[sheet_name]
-        self.tree.delete(*self.tree.get_children())
-        headers = [str(cell.value) if cell.value is not None else "" for cell in next(sheet.iter_rows(max_row=1))]
-        self.tree["columns"] = headers
+        # The cache mirrors the file on disk, so it is only used until the workbook is loaded.
+        cached = None
+        cache_key = f"formulas:{sheet_name}" if self.formula_mode.get() else f"sheet:{sheet_name}"
+        if self.workbook is None and self.workbook_path:
+            cached = self.parse_cache.get(self.workbook_path, cache_key)
+        if cached is not None:
+            headers, self.data_rows = cached
+        else:
+            sheet = self._ensure_workbook()[sheet_name]
+            headers = [str(cell.value) if cell.value is not None else "" for cell in next(sheet.iter_rows(max_row=1))]
+            self.data_rows = []
+            for row in sheet.iter_rows(min_row=2, values_only=True):
+                data_row = [str(v) if v is not None else "" for v in row]
+                data_row = data_row[:len(headers)] + [""] * (len(headers) - len(data_row))
+                self.data_rows.append(data_row)
+            if self.workbook_path == self.file_path and not self.unsaved_changes:
+                self.parse_cache.put(self.workbook_path, cache_key, (headers, self.data_rows))
         self.tree["show"] = "headings"
-        self._refresh_headings()
-        self.data_rows = []
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            data_row = [str(v) if v is not None else "" for v in row]
-            data_row = data_row[:len(headers)] + [""] * (len(headers) - len(data_row))
-            self.data_rows.append(data_row)
-            self.tree.insert("", "end", values=data_row)
+        self._set_headers(headers)
+        self._show_all_rows()
 
     def read_csv(self, file_path):
-        with open(file_path, newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            rows = list(reader)
+        self.follow_offset = self.follow_partial = None
+        if _split_compression(file_path)[1]:
+            # Only compressed sources are cached; a plain CSV parses about as fast as the cache loads.
+            cached = self.parse_cache.get(file_path, "delimited")
+            if cached is None:
+                cached = _read_delimited(file_path)
+                self.parse_cache.put(file_path, "delimited", cached)
+        else:
+            # Read up to a fixed size so bytes appended meanwhile are left for follow mode,
+            # which resumes after the last complete line.
+            size = os.path.getsize(file_path)
+            cached = _read_delimited(file_path, size)
+            self.follow_offset = _complete_lines_end(file_path, size) or size
+        csv_format, rows = cached
+        self.csv_format = dict(csv_format)
         if not rows: return
-        self.tree.delete(*self.tree.get_children())
-        self.tree["columns"] = rows[0]
         self.tree["show"] = "headings"
-        self._refresh_headings()
+        self._set_headers(rows[0])
         self.data_rows = [list(row) for row in rows[1:]]
-        for row in self.data_rows:
-            self.tree.insert("", "end", values=row)
+        if self.follow_offset is not None and self.follow_offset < size and self.data_rows:
+            # The file ends in a line without a newline: shown as read, completed if it grows.
+            self.follow_partial = self.data_rows[-1]
+        self._show_all_rows()
+
+    def read_columnar(self, file_path, columns=None):
+        if columns is None:
+            names = _read_columnar_schema(file_path).names
+            if len(names) > COLUMN_PICKER_THRESHOLD:
+                dialog = ColumnPickerDialog(self.root, "Select Columns", 
+                                            f"{os.path.basename(file_path)} has {len(names)} columns.\n"
+                                            "Select the columns to load (Cancel loads all):", names)
+                columns = dialog.selected or None
+        self.columnar_schema, headers, self.data_rows = _read_columnar(file_path, columns)
+        if len(headers) < len(_read_columnar_schema(file_path).names):
+            # Saving back to this file would drop the columns that were not loaded.
+            self.projected_from = os.path.abspath(file_path)
+        self.tree["show"] = "headings"
+        self._set_headers(headers)
+        self._show_all_rows()
+
+    def read_into_store(self, file_path, sheet_name=None):
+        """Streams a sheet into a temporary SQLite database (out-of-core mode)."""
+        rows = _iter_source_rows(file_path, sheet_name, self.csv_format if _is_delimited_path(file_path) else None)
+        headers = next(rows, [])
+        self._close_store()
+        self.store = SqliteTableStore(len(headers))
+        def progress(count):
+            self._update_status_bar(f"Loading {os.path.basename(file_path)} into out-of-core store: {count:,} rows...")
+            self.root.update_idletasks()
+        self.store.load(rows, progress)
+        self.data_rows = []
+        self.row_offset = 0
+        self.tree["show"] = "headings"
+        self._set_headers(headers)
+        self._render_rows()
+
+    def _close_store(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+            self.row_offset = 0
+
+    # ---------------- Formula Mode ----------------
+    def _formula_engine(self):
+        """Returns the formula engine for the current table, (re)building it when the rows were replaced."""
+        if not self.formula_mode.get() or self.store is not None: return None
+        if self.formulas is None or self.formulas.rows is not self.data_rows or self.formulas.headers is not self.headers:
+            self.formulas = FormulaEngine(self.data_rows, self.headers)
+        return self.formulas
+
+    def toggle_formula_mode(self):
+        self.formulas = None
+        if self.store is not None:
+            self.formula_mode.set(False)
+            messagebox.showinfo("Out-of-Core Mode", "Formula mode is not available for tables opened out-of-core.")
+            return
+        if self.file_type == "excel" and self.workbook_path and os.path.exists(self.workbook_path):
+            if self._has_unsaved_changes() and not messagebox.askyesno(
+                    "Unsaved Changes", "Switching formula mode reloads the workbook and discards unsaved changes. Continue?"):
+                self.formula_mode.set(not self.formula_mode.get())
+                return
+            # Formulas and their cached values come from differently loaded workbooks.
+            self._discard_journal()
+            self.workspaces = {}
+            self.workbook = None
+            self.read_excel_sheet(self.current_sheet)
+            self.history.clear()
+            self._save_state()
+            self.unsaved_changes = False
+            self._start_journal()
+        else:
+            self._refresh_visible_values()
+        self._update_status_bar()
+
+    def _require_values_mode(self, action):
+        """Returns True unless formula mode is on, where `action` would break cell references."""
+        if not self.formula_mode.get() or self.store is not None: return True
+        messagebox.showinfo("Formula Mode", f"{action} is not available in formula mode because it would shift the cells formulas refer to.")
+        return False
+
+    def _require_in_memory(self, action):
+        """Returns True unless the table is out-of-core, where `action` is not supported."""
+        if self.store is None: return True
+        messagebox.showinfo("Out-of-Core Mode", f"{action} is not available for tables opened out-of-core.")
+        return False
+
+    def _overwrites_projected_source(self, file_path):
+        return self.projected_from is not None and os.path.abspath(file_path) == self.projected_from
 
     def save_file(self):
         if not self.file_path:
             self.save_as_file()
             return
-        if self.file_type == "excel" and not self.workbook:
+        if self._overwrites_projected_source(self.file_path):
+            messagebox.showinfo("Save", f"Only {len(self.headers)} of the columns of {os.path.basename(self.file_path)} "
+                                "were loaded, so saving over it would drop the others. Choose a new file.")
+            self.save_as_file()
+            return
+        if self.file_type == "excel" and not self.workbook and not self.workbook_path:
              messagebox.showerror("Error", "Workbook object not loaded. Please use 'Save As'.")
              return
         self._save_to_file(self.file_path)
 
     def save_as_file(self):
         file_path = filedialog.asksaveasfilename(
-            defaultextension=".xlsx" if self.file_type == "excel" else ".csv",
-            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")],
+            defaultextension={"excel": ".xlsx", "columnar": ".parquet"}.get(self.file_type, ".csv"),
+            filetypes=self._file_dialog_types(saving=True),
         )
         if file_path:
             self.file_path = file_path
             self._save_to_file(file_path)
 
     def _save_to_file(self, file_path):
+        if self._overwrites_projected_source(file_path):
+            messagebox.showerror("Error", f"Only some columns of {os.path.basename(file_path)} were loaded; "
+                                 "saving over it would drop the others. Save to a different file.")
+            return
         try:
-            data_to_save = self.data_rows 
-            headers = self.tree["columns"]
+            # Out-of-core tables stream from the database instead of an in-memory list.
+            data_to_save = self.store.iter_rows() if self.store is not None else self.data_rows 
+            headers = self.headers
             
-            if file_path.lower().endswith((".xlsx", ".xls")) and self.file_type == "excel":
-                if not self.workbook: 
+            if file_path.lower().endswith((".xlsx", ".xls")) and self.store is not None:
+                self._save_excel_streaming(file_path, headers, data_to_save)
+
+            elif file_path.lower().endswith((".xlsx", ".xls")):
+                if not self._ensure_workbook(): 
+                    from openpyxl import Workbook
                     self.workbook = Workbook()
                     ws = self.workbook.active
                     ws.title = self.current_sheet if self.current_sheet else "Sheet1"
-                else:
-                    ws = self.workbook[self.current_sheet]
 
-                ws.delete_rows(1, ws.max_row) 
-                ws.append(headers)
-                for row in data_to_save:
-                    ws.append(row)
+                # Every modified sheet is written in this one save; untouched sheets are left as loaded.
+                tables = [(name, workspace.headers, workspace.data_rows)
+                          for name, workspace in self.workspaces.items()
+                          if workspace.unsaved_changes and name in self.workbook.sheetnames]
+                tables.append((self.current_sheet, headers, data_to_save))
+                for name, sheet_headers, rows in tables:
+                    ws = self.workbook[name]
+                    ws.delete_rows(1, ws.max_row) 
+                    ws.append(sheet_headers)
+                    if self.formula_mode.get():
+                        # Formulas only see numbers if numeric cells are written as numbers, not text.
+                        rows = ([_excel_value(v) for v in row] for row in rows)
+                    for row in rows:
+                        ws.append(row)
                     
                 self.workbook.save(file_path)
+                self.workbook_path = file_path
+                for workspace in self.workspaces.values():
+                    workspace.unsaved_changes = False
                 
-            elif file_path.lower().endswith(".csv") or self.file_type == "csv":
-                with open(file_path, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(headers)
-                    writer.writerows(data_to_save)
+            elif _columnar_kind(file_path):
+                if not _pyarrow_available():
+                    raise RuntimeError("Parquet/Feather support requires pyarrow (pip install pyarrow).")
+                _write_columnar(file_path, headers, list(data_to_save), self.columnar_schema)
+
+            elif _is_delimited_path(file_path) or self.file_type == "csv":
+                self.csv_format = _default_csv_format(file_path, self.csv_format)
+                try:
+                    written = _write_delimited(file_path, headers, data_to_save, self.csv_format)
+                except UnicodeEncodeError as e:
+                    if not messagebox.askyesno("Save", f"{e.object[e.start:e.end]!r} cannot be saved in the file's "
+                                               f"encoding ({self.csv_format['encoding']}).\n\nSave it as UTF-8 instead?"):
+                        self._update_status_bar("Not saved; the file was left unchanged.")
+                        return
+                    self.csv_format["encoding"] = "utf-8"
+                    data_to_save = self.store.iter_rows() if self.store is not None else self.data_rows
+                    written = _write_delimited(file_path, headers, data_to_save, self.csv_format)
+                self.follow_offset = None if _split_compression(file_path)[1] else written
+                self.follow_partial = None
                     
             self.unsaved_changes = False
+            self._discard_journal()
+            self._start_journal()
             self._update_status_bar()
             messagebox.showinfo("Saved", f"File saved successfully: {os.path.basename(file_path)}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save file\n{e}")
 
+    def _view_rows_for_export(self, selection_only=False):
+        """Yields the rows shown in the grid (filtered and sorted), or only the selected ones,
+        without copying the table. Formula cells are exported as their results."""
+        if self.store is not None:
+            if selection_only:
+                return (self.store.get_row(int(item)) for item in self.tree.selection())
+            return self.store.iter_rows(filtered=True)
+        indices = [int(item) for item in self.tree.selection()] if selection_only else self.view_rows
+        engine = self._formula_engine()
+        if engine is None or not engine.formulas:
+            return (self.data_rows[i] for i in indices)
+        return ([engine.display(i, c) if (i, c) in engine.formulas else value for c, value in enumerate(self.data_rows[i])]
+                for i in indices)
+
+    def export_view(self, selection_only=False):
+        if not self.headers:
+            messagebox.showwarning("Warning", "Open a file or create new sheet first.")
+            return
+        if selection_only and not self.tree.selection():
+            messagebox.showwarning("Warning", "Select the rows to export first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=self._file_dialog_types(saving=True))
+        if not file_path: return
+        count = 0
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+        try:
+            _export_table(file_path, self.headers, counted(self._view_rows_for_export(selection_only)),
+                          self.csv_format, self.current_sheet)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export\n{e}")
+            return
+        self._update_status_bar(f"Exported {count} rows to {os.path.basename(file_path)}.")
+
+    def _save_excel_streaming(self, file_path, headers, rows):
+        """Writes an xlsx with openpyxl's write-only mode so rows never pile up in memory.
+
+        The current sheet streams from `rows`; other sheets are copied row by row from
+        the source workbook (values only). Written to a temporary file first because
+        the source may be the file being replaced.
+        """
+        from openpyxl import Workbook, load_workbook
+        source = None
+        if self.workbook_path and os.path.exists(self.workbook_path):
+            source = load_workbook(filename=self.workbook_path, read_only=True, data_only=True)
+        try:
+            output = Workbook(write_only=True)
+            for name in (self.sheet_names if self.file_type == "excel" else [self.current_sheet or "Sheet1"]):
+                ws = output.create_sheet(title=name)
+                if name == self.current_sheet:
+                    ws.append(headers)
+                    for row in rows:
+                        ws.append(row)
+                elif source is not None and name in source.sheetnames:
+                    for row in source[name].iter_rows(values_only=True):
+                        ws.append(row)
+            tmp_path = file_path + ".tmp"
+            output.save(tmp_path)
+        finally:
+            if source is not None:
+                source.close()
+        os.replace(tmp_path, file_path)
+        if self.file_type == "excel":
+            self.workbook_path = file_path
+
     def rename_sheet(self):
-        if self.file_type != "excel" or not self.workbook:
+        if not self._require_in_memory("Renaming sheets"): return
+        if self.file_type != "excel" or not self._ensure_workbook():
             messagebox.showwarning("Warning", "Sheet renaming is only available for open Excel files or new sheets.")
             return
 
@@ -610,40 +2937,53 @@ class ExcelEditor:
             return
 
         try:
-            sheet = self.workbook[selected_sheet]
-            sheet.title = new_name
-            
-            old_index = self.sheet_names.index(selected_sheet)
-            self.sheet_names[old_index] = new_name
-            
-            self.sheet_selector.config(values=self.sheet_names)
-            
-            if self.current_sheet == selected_sheet:
-                self.current_sheet = new_name
-                self.sheet_selector.set(new_name)
-                self._update_status_bar()
-            else:
-                 self.sheet_selector.set(self.current_sheet)
-            
-            self.unsaved_changes = True
+            self._rename_sheet(selected_sheet, new_name)
+            self._journal_ops([("rename_sheet", selected_sheet, new_name)])
             self._update_status_bar(f"Sheet '{selected_sheet}' renamed to '{new_name}'.")
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to rename sheet: {e}")
+
+    def _rename_sheet(self, selected_sheet, new_name):
+        """Renames a sheet in the workbook, the sheet list and its workspace (also used by crash recovery)."""
+        sheet = self._ensure_workbook()[selected_sheet]
+        sheet.title = new_name
+        
+        old_index = self.sheet_names.index(selected_sheet)
+        self.sheet_names[old_index] = new_name
+        
+        self.sheet_selector.config(values=self.sheet_names)
+        
+        if selected_sheet in self.workspaces:
+            self.workspaces[new_name] = self.workspaces.pop(selected_sheet)
+        if self.current_sheet == selected_sheet:
+            self.current_sheet = new_name
+            self.sheet_selector.set(new_name)
+        else:
+             self.sheet_selector.set(self.current_sheet)
+        
+        self.unsaved_changes = True
             
     # ---------------- Data / Structure Manipulation ----------------
     def create_new_sheet(self):
         # 1. Clear Data and UI
-        self.tree.delete(*self.tree.get_children())
-        self.tree["columns"] = ["Column1", "Column2", "Column3"]
+        self._close_store()
+        self.workspaces = {}
+        self.pivot_source = None
+        self._stop_follow()
         self.tree["show"] = "headings"
-        self._refresh_headings()
+        self._set_headers(["Column1", "Column2", "Column3"])
         self.data_rows = []
+        self._show_all_rows()
         
         # 2. Initialize a new Workbook (THE FIX)
+        self._discard_journal()
         self.file_path = None
         self.file_type = "excel"
+        from openpyxl import Workbook
         self.workbook = Workbook()
+        self.workbook_path = None
+        self.csv_format = dict(DEFAULT_CSV_FORMAT)
         
         # Set initial sheet name and update UI
         ws = self.workbook.active
@@ -661,26 +3001,55 @@ class ExcelEditor:
         self.unsaved_changes = False
         self._update_status_bar()
 
+    def load_table(self, headers, rows, title):
+        """Shows a derived table (e.g. a group-by result) as a new unsaved document."""
+        self._discard_journal()
+        self._close_store()
+        self.workspaces = {}
+        self.pivot_source = None
+        self._stop_follow()
+        self.file_path = None
+        self.file_type = "csv"
+        self.workbook = None
+        self.workbook_path = None
+        self.csv_format = dict(DEFAULT_CSV_FORMAT)
+        self.columnar_schema = None
+        self.projected_from = None
+        self.sheet_names = [title]
+        self.current_sheet = title
+        self.sheet_selector.config(values=self.sheet_names)
+        self.sheet_selector.set(title)
+        self.data_rows = rows
+        self.tree["show"] = "headings"
+        self._set_headers(headers)
+        self._show_all_rows()
+        self.history.clear()
+        self.current_sort_col = None
+        self.current_sort_reverse = False
+        self._save_state()
+        self.unsaved_changes = True
+        self._update_status_bar()
+
     def _insert_new_column(self, col_index):
         col_name = simpledialog.askstring("New Column Name", f"Enter name for column #{col_index + 1}:")
-        if not col_name: return False
-
-        headers = list(self.tree["columns"])
-        headers.insert(col_index, col_name)
-        self.tree["columns"] = headers
-        self._refresh_headings()
-        
-        for row in self.data_rows:
-            if col_index > len(row):
-                 row.extend([""] * (col_index - len(row)))
-            row.insert(col_index, "")
-        return True
+        if not col_name: return None
+        op = ("insert_col", col_index, col_name)
+        self._apply_ops(op)
+        return op
 
     def _insert_new_row(self, row_index):
-        new_row = [""] * len(self.tree["columns"])
-        self.data_rows.insert(row_index, new_row)
+        op = ("insert_row", row_index)
+        self._apply_ops(op)
+        return op
+
+    def _keep_partial_paste(self, ops):
+        """Records rows/columns inserted before a paste was cancelled so history and journal stay in step."""
+        if ops:
+            self.clear_filter()
+            self._save_state(*ops)
 
     def paste_vertical(self):
+        if not self._require_in_memory("Pasting"): return
         data_2d, delimiter = self._get_paste_data()
         if data_2d is None or not data_2d: return
 
@@ -693,38 +3062,37 @@ class ExcelEditor:
         
         position = dialog.position
         if position is None: return
+        if position in ("INSERT_BEFORE", "INSERT_AFTER") and not self._require_values_mode("Inserting while pasting"): return
 
         start_row = self.selected_row_index if self.selected_row_index is not None else len(self.data_rows)
         start_col = self.selected_col_index if self.selected_col_index is not None else 0
         
+        ops = []
         if position == "INSERT_BEFORE":
-            for _ in range(rows_to_paste): self._insert_new_row(start_row)
+            for _ in range(rows_to_paste): ops.append(self._insert_new_row(start_row))
         elif position == "INSERT_AFTER":
-            for _ in range(rows_to_paste): self._insert_new_row(start_row + 1)
+            for _ in range(rows_to_paste): ops.append(self._insert_new_row(start_row + 1))
             start_row += 1 
         elif position == "APPEND":
             start_row = len(self.data_rows)
-            for _ in range(rows_to_paste): self._insert_new_row(len(self.data_rows))
+            for _ in range(rows_to_paste): ops.append(self._insert_new_row(len(self.data_rows)))
         
-        virtual_result = f"Pasting {rows_to_paste} cells vertically into Column {self.tree['columns'][start_col]}."
+        virtual_result = f"Pasting {rows_to_paste} cells vertically into Column {self.headers[start_col]}."
         virtual_result += f"\nStarting at Row {start_row + 1}. Mode: {position}."
-        if not messagebox.askokcancel("Confirm Vertical Paste", virtual_result): return
+        if not messagebox.askokcancel("Confirm Vertical Paste", virtual_result):
+            self._keep_partial_paste(ops)
+            return
 
-        for i, value in enumerate(data_list):
-            target_row_index = start_row + i
-            target_row = self.data_rows[target_row_index]
-            
-            if start_col >= len(target_row):
-                target_row.extend([""] * (start_col - len(target_row) + 1))
-            
-            target_row[start_col] = value
+        edits = [("set", start_row + i, start_col, value) for i, value in enumerate(data_list)]
+        self._apply_ops(*edits)
 
         self.clear_filter() 
-        self._save_state()
+        self._save_state(*ops, *edits)
         self._update_status_bar(f"Pasted {rows_to_paste} cells vertically.")
 
 
     def paste_horizontal(self):
+        if not self._require_in_memory("Pasting"): return
         data_2d, delimiter = self._get_paste_data()
         if data_2d is None or not data_2d: return
         
@@ -733,228 +3101,756 @@ class ExcelEditor:
 
         orientation = 'col'
         dialog = PastePositionDialog(self.root, "Paste Horizontal Position", orientation, 
-                                     self.selected_col_index, len(self.tree["columns"]))
+                                     self.selected_col_index, len(self.headers))
         
         position = dialog.position
         if position is None: return
+        if position in ("INSERT_BEFORE", "INSERT_AFTER") and not self._require_values_mode("Inserting while pasting"): return
         
         start_row = self.selected_row_index if self.selected_row_index is not None else 0
-        start_col = self.selected_col_index if self.selected_col_index is not None else len(self.tree["columns"])
+        start_col = self.selected_col_index if self.selected_col_index is not None else len(self.headers)
         
+        ops = []
         if position == "INSERT_BEFORE":
             for _ in range(cols_to_paste): 
-                if not self._insert_new_column(start_col): return
+                ops.append(self._insert_new_column(start_col))
+                if not ops[-1]: return self._keep_partial_paste(ops[:-1])
         elif position == "INSERT_AFTER":
             for _ in range(cols_to_paste): 
-                if not self._insert_new_column(start_col + 1): return
+                ops.append(self._insert_new_column(start_col + 1))
+                if not ops[-1]: return self._keep_partial_paste(ops[:-1])
             start_col += cols_to_paste
         elif position == "APPEND":
-            start_col = len(self.tree["columns"])
+            start_col = len(self.headers)
             for _ in range(cols_to_paste): 
-                if not self._insert_new_column(len(self.tree["columns"])): return
+                ops.append(self._insert_new_column(len(self.headers)))
+                if not ops[-1]: return self._keep_partial_paste(ops[:-1])
 
-        current_col_name = self.tree['columns'][start_col] if start_col < len(self.tree['columns']) else "NEW"
+        current_col_name = self.headers[start_col] if start_col < len(self.headers) else "NEW"
         virtual_result = f"Pasting {cols_to_paste} cells horizontally into Row {start_row + 1}."
         virtual_result += f"\nStarting at Column {current_col_name}. Mode: {position}."
 
-        if not messagebox.askokcancel("Confirm Horizontal Paste", virtual_result): return
+        if not messagebox.askokcancel("Confirm Horizontal Paste", virtual_result):
+            self._keep_partial_paste(ops)
+            return
 
-        target_row = self.data_rows[start_row]
-        
-        if position in ("OVERWRITE_START", "APPEND"):
-            if start_col + cols_to_paste > len(target_row):
-                padding = start_col + cols_to_paste - len(target_row)
-                target_row.extend([""] * padding)
-                
-        for i, value in enumerate(data_list):
-            target_row[start_col + i] = value
+        edits = [("set", start_row, start_col + i, value) for i, value in enumerate(data_list)]
+        self._apply_ops(*edits)
 
         self.clear_filter() 
-        self._save_state()
+        self._save_state(*ops, *edits)
         self._update_status_bar(f"Pasted {cols_to_paste} cells horizontally.")
 
     # ---------------- Other Manipulation Functions (UNCHANGED logic) ----------------
 
     def add_row(self):
-        if not self.tree["columns"]:
+        if not self.headers:
             messagebox.showwarning("Warning", "Open a file or create new sheet first.")
             return
-        new_row = [""] * len(self.tree["columns"])
-        self.data_rows.append(new_row)
-        self.tree.insert("", "end", values=new_row)
-        self._save_state()
+        if self.store is not None:
+            self.store.insert_blank()
+            self._render_rows()
+            self._save_state()
+            return
+        op = self._insert_new_row(len(self.data_rows))
+        self.view_rows.append(len(self.data_rows) - 1)
+        self._insert_item(len(self.data_rows) - 1)
+        self._save_state(op)
 
     def add_column(self):
-        if not self.tree["columns"]:
+        if not self._require_in_memory("Adding columns"): return
+        if not self.headers:
             messagebox.showwarning("Warning", "Open a file or create new sheet first.")
             return
-        self._insert_new_column(len(self.tree["columns"]))
+        op = self._insert_new_column(len(self.headers))
+        if not op: return
         self.clear_filter()
-        self._save_state()
+        self._save_state(op)
 
     def delete_row(self):
+        if not self._require_values_mode("Deleting rows"): return
         if self.selected_row_index is not None:
-            del self.data_rows[self.selected_row_index]
-            self.tree.delete(self.tree.selection())
-            self._save_state()
+            idx = self.selected_row_index
+            if self.store is not None:
+                self.store.delete(idx)
+                self._render_rows()
+                self._save_state()
+                return
+            op = ("delete_row", idx)
+            self._apply_ops(op)
+            # Item ids are row indices, so the rows below the deleted one are renumbered.
+            self.view_rows = [i - (i > idx) for i in self.view_rows if i != idx]
+            self._render_rows()
+            self._save_state(op)
 
     def delete_column(self):
+        if not self._require_values_mode("Deleting columns"): return
+        if not self._require_in_memory("Deleting columns"): return
         if self.selected_col_index is not None:
-            col_idx = self.selected_col_index
-            headers = list(self.tree["columns"])
-            headers.pop(col_idx)
-            self.tree["columns"] = headers
-            for row in self.data_rows:
-                if col_idx < len(row):
-                    row.pop(col_idx)
-            self._refresh_headings()
+            op = ("delete_col", self.selected_col_index)
+            self._apply_ops(op)
             self.clear_filter()
-            self._save_state()
+            self._save_state(op)
             
+    # ---------------- Dedupe / Group By ----------------
+    def remove_duplicates(self):
+        if not self._require_values_mode("Removing duplicates"): return
+        if not self._require_in_memory("Removing duplicates"): return
+        if not self.headers: return
+        dialog = ColumnPickerDialog(self.root, "Remove Duplicate Rows",
+                                    "Rows are duplicates when these columns match\n(keeps the first occurrence):",
+                                    self.headers)
+        if not dialog.selected: return
+        key_cols = [self.headers.index(name) for name in dialog.selected]
+        duplicates = _duplicate_row_indices(self.data_rows, key_cols)
+        if not duplicates:
+            self._update_status_bar("No duplicate rows found.")
+            return
+        op = ("drop_rows", duplicates)
+        self._apply_ops(op)
+        self.clear_filter()
+        self._save_state(op)
+        self._update_status_bar(f"Removed {len(duplicates)} duplicate rows.")
+
+    def group_by(self):
+        if not self.headers: return
+        dialog = GroupByDialog(self.root, self.headers)
+        if not dialog.result: return
+        key_cols, value_col, aggregates = dialog.result
+        # Groups the rows currently shown (out-of-core tables stream the filtered rows from the database).
+        if self.store is not None:
+            rows = self.store.iter_rows(filtered=True)
+        else:
+            rows = (self.data_rows[i] for i in self.view_rows)
+        result = _group_rows(rows, key_cols, value_col, aggregates)
+        value_name = self.headers[value_col] if value_col is not None else None
+        headers = [self.headers[i] for i in key_cols]
+        headers += [name if name == "count" or value_name is None else f"{name}({value_name})" for name in aggregates]
+        ExcelEditor(tk.Toplevel(self.root)).load_table(headers, result, "Grouped")
+
+    # ---------------- Pivot Table ----------------
+    def _pivot_result(self, row_col, col_col, value_col, aggregate):
+        # Pivots the rows currently shown, like Group By.
+        if self.store is not None:
+            rows = self.store.iter_rows(filtered=True)
+        else:
+            rows = (self.data_rows[i] for i in self.view_rows)
+        return _pivot_rows(rows, row_col, col_col, value_col, aggregate, self.headers[row_col])
+
+    def pivot_table(self):
+        if not self.headers: return
+        dialog = PivotDialog(self.root, self.headers)
+        if not dialog.result: return
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            headers, rows = self._pivot_result(*dialog.result)
+        finally:
+            self.root.config(cursor="")
+        pivot = ExcelEditor(tk.Toplevel(self.root))
+        pivot.load_table(headers, rows, "Pivot")
+        # The settings refer to columns by name so the pivot survives column moves in the source.
+        row_col, col_col, value_col, aggregate = dialog.result
+        settings = (self.headers[row_col], self.headers[col_col],
+                    self.headers[value_col] if value_col is not None else None, aggregate)
+        pivot.pivot_source = (self, settings)
+        pivot._update_status_bar(f"Pivot of {self.current_sheet or 'table'}: {len(rows) - 1} x {len(headers) - 2}. "
+                                 "Use Data > Refresh Pivot Table after editing the source.")
+
+    def refresh_pivot(self):
+        """Recomputes this pivot table from the current contents of its source window."""
+        if self.pivot_source is None:
+            messagebox.showinfo("Refresh Pivot Table", "This window does not show a pivot table.")
+            return
+        source, (row_name, col_name, value_name, aggregate) = self.pivot_source
+        if not source.root.winfo_exists():
+            messagebox.showerror("Refresh Pivot Table", "The source window of this pivot table has been closed.")
+            return
+        missing = [name for name in (row_name, col_name, value_name) if name is not None and name not in source.headers]
+        if missing:
+            messagebox.showerror("Refresh Pivot Table", f"The source no longer has the column(s): {', '.join(missing)}")
+            return
+        value_col = source.headers.index(value_name) if value_name is not None else None
+        headers, rows = source._pivot_result(source.headers.index(row_name), source.headers.index(col_name), value_col, aggregate)
+        # Replaces the table in place as one undoable step.
+        self.data_rows = rows
+        self._set_headers(headers)
+        self.clear_filter()
+        self._save_state()
+        self._update_status_bar("Pivot table refreshed.")
+
+    # ---------------- Merge (Join) ----------------
+    def _other_table_rows(self, source):
+        """Yields the rows (header first) of another sheet of this workbook, or of a file path."""
+        if self.file_type == "excel" and source in (self.sheet_names or []):
+            workspace = self.workspaces.get(source)
+            if workspace is not None:
+                # A sheet visited in this session, with any unsaved edits.
+                yield list(workspace.headers)
+                yield from workspace.data_rows
+            elif self.workbook is not None:
+                for row in self.workbook[source].iter_rows(values_only=True):
+                    yield [_cell_text(v) for v in row]
+            else:
+                yield from _iter_source_rows(self.workbook_path, source)
+        else:
+            yield from _iter_source_rows(source)
+
+    def _other_table_headers(self, source):
+        rows = self._other_table_rows(source)
+        try:
+            return next(rows, [])
+        finally:
+            rows.close()
+
+    def merge_table(self):
+        if not self._require_values_mode("Merging"): return
+        if not self._require_in_memory("Merging"): return
+        if not self.headers: return
+        sheets = [name for name in (self.sheet_names or []) if name != self.current_sheet] if self.file_type == "excel" else []
+        dialog = JoinDialog(self.root, self.headers, sheets, self._other_table_headers, self._file_dialog_types())
+        if not dialog.result: return
+        source, left_keys, right_keys, right_cols, how = dialog.result
+        try:
+            rows = self._other_table_rows(source)
+            other_headers = next(rows, [])
+            # Only the key and added columns are kept from the other table.
+            needed = sorted(set(right_keys) | set(right_cols))
+            position = {col: i for i, col in enumerate(needed)}
+            other_rows = [_row_key(row, needed) for row in rows]
+        except Exception as e:
+            messagebox.showerror("Merge", f"Failed to read {source}\n{e}")
+            return
+        joined = _join_rows(self.data_rows, other_rows, left_keys,
+                            [position[c] for c in right_keys], [position[c] for c in right_cols], how,
+                            width=len(self.headers))
+        added = _unique_names(self.headers, [other_headers[c] if c < len(other_headers) else f"Column{c + 1}" for c in right_cols])
+        self.data_rows = joined
+        self._set_headers(self.headers + added)
+        self.clear_filter()
+        self._save_state()
+        self._update_status_bar(f"Merged {len(added)} columns from {os.path.basename(source)} ({how} join, {len(joined)} rows).")
+
+    # ---------------- Memory Diagnostics ----------------
+    def _memory_report(self):
+        """Returns [(component, bytes or None, details)] for the diagnostics window."""
+        import tracemalloc
+        report = []
+        seen = set()
+        report.append(("Table rows", _rows_footprint(self.data_rows, seen),
+                       f"{len(self.data_rows)} rows x {len(self.headers)} columns"))
+
+        # Snapshots copy the row lists but share unchanged cell strings with the table.
+        entry_sizes = [_rows_footprint(rows, seen) for rows, _ in self.history]
+        if entry_sizes:
+            details = (f"{len(entry_sizes)} of {self.history.maxlen} snapshots, "
+                       f"{_format_bytes(sum(entry_sizes) / len(entry_sizes))} per entry on average, "
+                       f"largest {_format_bytes(max(entry_sizes))}")
+        else:
+            details = "empty"
+        report.append(("Undo history", sum(entry_sizes), details))
+
+        if self.workspaces:
+            size = sum(_rows_footprint(ws.data_rows, seen) + sum(_rows_footprint(rows, seen) for rows, _ in ws.history)
+                       for ws in self.workspaces.values())
+            report.append(("Other sheets", size, f"{len(self.workspaces)} sheets kept with their history"))
+
+        if self.workbook is not None:
+            size, count = _workbook_footprint(self.workbook)
+            report.append(("openpyxl workbook", size, f"{count} cell objects in {len(self.workbook.worksheets)} sheets (estimate)"))
+        else:
+            report.append(("openpyxl workbook", 0, "not loaded"))
+
+        if self.formulas is not None:
+            report.append(("Formula engine", None, f"{len(self.formulas.formulas)} formulas, {len(self.formulas.values)} cached results"))
+
+        items = self.tree.get_children()
+        tk_cells = len(items) * self.col_window
+        # Item values live in Tcl objects, outside Python's heap; estimate from a sample of items.
+        sample = items[::max(1, len(items) // 200)]
+        text = sum(len(str(v)) for item in sample for v in self.tree.item(item, "values"))
+        estimate = (text * len(items) // len(sample) if sample else 0) + tk_cells * 48
+        report.append(("Grid (Treeview) items", estimate, f"{len(items)} items, {tk_cells} cell values held by Tk (estimate)"))
+
+        if self.store is not None:
+            db_size = os.path.getsize(self.store.path) if os.path.exists(self.store.path) else 0
+            report.append(("Out-of-core store", None, f"{_format_bytes(db_size)} on disk, rows are not held in memory"))
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report.append(("tracemalloc (Python heap)", current, f"peak {_format_bytes(peak)}"))
+            for group, size in _traced_memory_by_package():
+                report.append((f"    {group}", size, "allocated since tracing started"))
+        else:
+            report.append(("tracemalloc", None, "not tracing (start it here or run with --trace-memory)"))
+
+        rss = _process_rss()
+        report.append(("Process resident memory", rss, "includes Tk, openpyxl and interpreter" if rss is not None else "unavailable"))
+        return report
+
+    def show_memory_diagnostics(self):
+        import tracemalloc
+        window = tk.Toplevel(self.root)
+        window.title("Memory Diagnostics")
+        window.geometry("760x420")
+        table = ttk.Treeview(window, columns=("component", "size", "details"), show="headings")
+        for col_id, text, width in (("component", "Component", 220), ("size", "Size", 100), ("details", "Details", 420)):
+            table.heading(col_id, text=text)
+            table.column(col_id, width=width, anchor="w")
+        table.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def refresh():
+            window.config(cursor="watch")
+            window.update_idletasks()
+            table.delete(*table.get_children())
+            for component, size, details in self._memory_report():
+                table.insert("", "end", values=(component, _format_bytes(size) if size is not None else "", details))
+            trace_button.config(text="Stop Tracing" if tracemalloc.is_tracing() else "Start Tracing")
+            window.config(cursor="")
+
+        def toggle_tracing():
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            else:
+                tracemalloc.start()
+            refresh()
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill=tk.X, pady=5)
+        tk.Button(buttons, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Trim Undo History", command=lambda: (self.trim_history(), refresh())).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Release Caches", command=lambda: (self.release_caches(), refresh())).pack(side=tk.LEFT, padx=5)
+        trace_button = tk.Button(buttons, text="Start Tracing", command=toggle_tracing)
+        trace_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Close", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+        refresh()
+
+    def trim_history(self):
+        """Drops every undo snapshot except the current one."""
+        if len(self.history) <= 1: return
+        dropped = len(self.history) - 1
+        self.history = deque([self.history[self.history_index]], maxlen=self.history.maxlen)
+        self.history_index = 0
+        self._journal_ops([("trim",)])
+        self._update_status_bar(f"Trimmed {dropped} undo snapshots.")
+
+    def release_caches(self):
+        """Frees memory that is rebuilt on demand: the openpyxl workbook (when nothing unsaved
+        depends on it), sheets without unsaved changes, and cached formula results."""
+        import gc
+        released = []
+        if self.workbook is not None and self.workbook_path and not self._has_unsaved_changes():
+            self.workbook = None
+            released.append("workbook")
+        clean = [name for name, ws in self.workspaces.items() if not ws.unsaved_changes]
+        for name in clean:
+            del self.workspaces[name]
+        if clean:
+            released.append(f"{len(clean)} unchanged sheets")
+        if self.formulas is not None:
+            self.formulas.values.clear()
+            self._refresh_visible_values()
+            released.append("formula results")
+        gc.collect()
+        self._update_status_bar("Released " + (", ".join(released) if released else "nothing") + ".")
+
+    # ---------------- Compare ----------------
+    def compare_table(self):
+        if not self._require_in_memory("Comparing"): return
+        if not self.headers: return
+        sheets = [name for name in (self.sheet_names or []) if name != self.current_sheet] if self.file_type == "excel" else []
+        dialog = CompareDialog(self.root, self.headers, sheets, self._file_dialog_types())
+        if not dialog.result: return
+        source, key_cols = dialog.result
+        try:
+            rows = self._other_table_rows(source)
+            other_headers = next(rows, [])
+            # Line the other table's columns up with ours by name.
+            positions = [other_headers.index(name) if name in other_headers else None for name in self.headers]
+            other_rows = [[row[p] if p is not None and p < len(row) else "" for p in positions] for row in rows]
+        except Exception as e:
+            messagebox.showerror("Compare", f"Failed to read {source}\n{e}")
+            return
+        columns = [c for c, p in enumerate(positions) if p is not None]
+        added, removed, modified = _diff_rows(other_rows, self.data_rows, columns, key_cols)
+
+        self.diff_marks = {}
+        for i in added:
+            self.diff_marks[id(self.data_rows[i])] = ("diff_added", self.data_rows[i])
+        for i in modified:
+            self.diff_marks[id(self.data_rows[i])] = ("diff_modified", self.data_rows[i])
+        self._render_rows()
+        notes = []
+        if len(columns) < len(self.headers):
+            notes.append("Only here: " + ", ".join(self.headers[c] for c, p in enumerate(positions) if p is None))
+        missing = [name for name in other_headers if name not in self.headers]
+        if missing:
+            notes.append(f"Only in {os.path.basename(source)}: " + ", ".join(missing))
+        self._show_diff_summary(source, added, [other_rows[j] for j in removed], modified, other_rows, notes)
+        self._update_status_bar(f"Compared with {os.path.basename(source)}: {len(added)} added, "
+                                f"{len(removed)} removed, {len(modified)} modified.")
+
+    def _show_diff_summary(self, source, added, removed_rows, modified, other_rows, notes):
+        window = tk.Toplevel(self.root)
+        window.title(f"Comparison with {os.path.basename(source)}")
+        window.geometry("700x400")
+        summary = f"{len(added)} added, {len(removed_rows)} removed, {len(modified)} modified rows."
+        for note in notes:
+            summary += f"\n{note}"
+        tk.Label(window, text=summary, justify=tk.LEFT, anchor="w").pack(fill=tk.X, padx=5, pady=5)
+
+        changes = ttk.Treeview(window, columns=("change", "row", "details"), show="headings")
+        for col_id, text, width in (("change", "Change", 80), ("row", "Row", 60), ("details", "Details", 540)):
+            changes.heading(col_id, text=text)
+            changes.column(col_id, width=width, anchor="w")
+        scrollbar = tk.Scrollbar(window, orient="vertical", command=changes.yview)
+        changes.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        changes.pack(fill=tk.BOTH, expand=True)
+
+        entries = [(i, "added", "") for i in added]
+        entries += [(i, "modified", "; ".join(f"{self.headers[c]}: {other_rows[j][c]!r} -> {self.data_rows[i][c]!r}" for c in cols))
+                    for i, (j, cols) in modified.items()]
+        entries.sort()
+        for i, change, details in entries[:DIFF_LIST_LIMIT]:
+            changes.insert("", "end", iid=str(i), values=(change, i + 1, details))
+        for row in removed_rows[:max(0, DIFF_LIST_LIMIT - len(entries))]:
+            changes.insert("", "end", values=("removed", "", ", ".join(row)))
+
+        def show_row(event):
+            item = changes.focus()
+            if item and self.tree.exists(item):
+                self.tree.selection_set(item)
+                self.tree.see(item)
+        changes.bind("<Double-1>", show_row)
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill=tk.X, pady=5)
+        if removed_rows:
+            tk.Button(buttons, text="Open Removed Rows",
+                      command=lambda: ExcelEditor(tk.Toplevel(self.root)).load_table(list(self.headers), removed_rows, "Removed")
+                      ).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Clear Highlights", command=self.clear_diff_highlights).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Close", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def clear_diff_highlights(self):
+        if not self.diff_marks: return
+        self.diff_marks = {}
+        self._render_rows()
+
     def add_row_above(self):
+        if not self._require_values_mode("Inserting rows"): return
+        if not self._require_in_memory("Inserting rows"): return
         if self.selected_row_index is None: return
-        self._insert_new_row(self.selected_row_index)
+        op = self._insert_new_row(self.selected_row_index)
         self.clear_filter()
-        self._save_state()
+        self._save_state(op)
 
     def add_row_below(self):
+        if not self._require_values_mode("Inserting rows"): return
+        if not self._require_in_memory("Inserting rows"): return
         if self.selected_row_index is None: return
-        self._insert_new_row(self.selected_row_index + 1)
+        op = self._insert_new_row(self.selected_row_index + 1)
         self.clear_filter()
-        self._save_state()
+        self._save_state(op)
 
     def clear_cell(self):
         selected_item_id = self.tree.selection()
         if not selected_item_id: return
         col_index = self.selected_col_index
-        item_values = list(self.tree.item(selected_item_id[0], "values"))
+        row_index = int(selected_item_id[0])
         
-        if col_index is not None and col_index < len(item_values):
-            item_values[col_index] = ""
-            self.tree.item(selected_item_id[0], values=item_values) 
-            try:
-                for i, row in enumerate(self.data_rows):
-                    if self.selected_row_index is not None and i == self.selected_row_index:
-                        self.data_rows[i][col_index] = ""
-                        self._save_state()
-                        return
-            except Exception:
-                pass 
+        if col_index is not None and col_index < len(self.headers) and self.store is not None:
+            self.store.update(row_index, col_index, "")
+            self._render_rows()
+            self._save_state()
+        elif col_index is not None and col_index < len(self.headers):
+            op = ("set", row_index, col_index, "")
+            self._apply_ops(op)
+            self._refresh_item(row_index)
+            self._save_state(op)
                 
     def move_row_up(self):
+        if not self._require_values_mode("Moving rows"): return
+        if not self._require_in_memory("Moving rows"): return
         idx = self.selected_row_index
         if idx is None or idx == 0: return
-        self.data_rows[idx - 1], self.data_rows[idx] = self.data_rows[idx], self.data_rows[idx - 1]
+        op = ("swap_rows", idx - 1, idx)
+        self._apply_ops(op)
         self.clear_filter()
-        self.tree.selection_set(self.tree.get_children()[idx-1])
-        self._save_state()
+        self.tree.selection_set(str(idx - 1))
+        self._save_state(op)
 
     def move_row_down(self):
+        if not self._require_values_mode("Moving rows"): return
+        if not self._require_in_memory("Moving rows"): return
         idx = self.selected_row_index
         if idx is None or idx >= len(self.data_rows)-1: return
-        self.data_rows[idx + 1], self.data_rows[idx] = self.data_rows[idx], self.data_rows[idx + 1]
+        op = ("swap_rows", idx, idx + 1)
+        self._apply_ops(op)
         self.clear_filter()
-        self.tree.selection_set(self.tree.get_children()[idx+1])
-        self._save_state()
+        self.tree.selection_set(str(idx + 1))
+        self._save_state(op)
 
     def move_column_left(self):
+        if not self._require_values_mode("Moving columns"): return
+        if not self._require_in_memory("Moving columns"): return
         idx = self.selected_col_index
         if idx is None or idx == 0: return
-        headers = list(self.tree["columns"])
-        headers[idx-1], headers[idx] = headers[idx], headers[idx-1]
-        self.tree["columns"] = headers
-        for row in self.data_rows:
-            if idx < len(row):
-                 row[idx-1], row[idx] = row[idx], row[idx-1]
-        self._refresh_headings()
+        op = ("swap_cols", idx - 1, idx)
+        self._apply_ops(op)
         self.clear_filter()
-        self._save_state()
+        self._save_state(op)
 
     def move_column_right(self):
+        if not self._require_values_mode("Moving columns"): return
+        if not self._require_in_memory("Moving columns"): return
         idx = self.selected_col_index
-        headers = list(self.tree["columns"])
-        if idx is None or idx >= len(headers)-1: return
-        headers[idx+1], headers[idx] = headers[idx], headers[idx+1]
-        self.tree["columns"] = headers
-        for row in self.data_rows:
-            if idx + 1 < len(row):
-                row[idx+1], row[idx] = row[idx], row[idx+1]
-        self._refresh_headings()
+        if idx is None or idx >= len(self.headers)-1: return
+        op = ("swap_cols", idx, idx + 1)
+        self._apply_ops(op)
         self.clear_filter()
-        self._save_state()
+        self._save_state(op)
+
+    # ---------------- Column Virtualization ----------------
+    def _set_headers(self, headers):
+        self.headers = list(headers)
+        self._layout_columns()
+
+    def _layout_columns(self):
+        """Binds the Treeview's display columns to the visible slice of self.headers.
+
+        Returns True if the window moved or changed size (item values are then stale).
+        """
+        width = self.tree.winfo_width()
+        fit = max(1, (width if width > 1 else DEFAULT_VIEW_WIDTH) // COLUMN_WIDTH)
+        window = min(len(self.headers), fit + 1) # +1 for the partly visible column on the right
+        offset = max(0, min(self.col_offset, len(self.headers) - fit))
+        changed = offset != self.col_offset or window != self.col_window
+        self.col_offset = offset
+        if window != self.col_window:
+            display_columns = [f"c{i}" for i in range(window)]
+            self.tree["columns"] = display_columns
+            for col_id in display_columns:
+                self.tree.column(col_id, width=COLUMN_WIDTH, anchor="center")
+            self.col_window = window
+            self._heading_text = {}
+        self._refresh_headings()
+        self._update_hsb()
+        return changed
 
     def _refresh_headings(self):
-        for idx, col_name in enumerate(self.tree["columns"]):
-            name_only = col_name.replace(' ▲', '').replace(' ▼', '')
+        self.ui.mark("headings")
+
+    def _draw_headings(self):
+        for pos in range(self.col_window):
+            idx = self.col_offset + pos
+            name_only = self.headers[idx] if idx < len(self.headers) else ""
             indicator = ''
             if idx == self.current_sort_col:
                 indicator = ' ▼' if self.current_sort_reverse else ' ▲'
-            self.tree.heading(f"#{idx+1}", text=name_only + indicator)
-            self.tree.column(f"#{idx+1}", width=120, anchor="center")
+            text = name_only + indicator
+            if self._heading_text.get(pos) != text:
+                self.tree.heading(f"#{pos+1}", text=text)
+                self._heading_text[pos] = text
+
+    def _update_hsb(self):
+        total = len(self.headers)
+        if not total:
+            self.hsb.set(0, 1)
+            return
+        self.hsb.set(self.col_offset / total, min(1.0, (self.col_offset + self.col_window) / total))
+
+    def _xview(self, *args):
+        """Horizontal scrollbar command: moves the column window instead of scrolling pixels."""
+        window = max(1, self.col_window - 1)
+        if args[0] == "moveto":
+            self.col_offset = int(float(args[1]) * len(self.headers))
+        elif args[0] == "scroll":
+            step = window if args[2] == "pages" else 1
+            self.col_offset += int(args[1]) * step
+        # Dragging the scrollbar fires many events; only the latest position is applied.
+        self.ui.mark("columns")
+
+    def _apply_col_offset(self):
+        if self._layout_columns():
+            self._refresh_visible_values()
+
+    def _on_tree_resize(self, event):
+        if self._layout_columns() or self.store is not None:
+            self._refresh_visible_values()
+
+    def _column_at(self, x):
+        """Returns the data column index under the x coordinate, or None."""
+        col = self.tree.identify_column(x)
+        if not col or col == '#0': return None
+        col_index = self.col_offset + int(col.replace("#", "")) - 1
+        return col_index if col_index < len(self.headers) else None
+
+    def _display_values(self, row, row_index=None):
+        values = row[self.col_offset:self.col_offset + self.col_window]
+        engine = self._formula_engine() if row_index is not None else None
+        if engine is not None and engine.formulas:
+            values = [engine.display(row_index, col) if (row_index, col) in engine.formulas else value
+                      for col, value in enumerate(values, self.col_offset)]
+        return values + [""] * (self.col_window - len(values))
+
+    def _insert_item(self, row_index):
+        row = self.data_rows[row_index]
+        mark = self.diff_marks.get(id(row))
+        self.tree.insert("", "end", iid=str(row_index), values=self._display_values(row, row_index),
+                         tags=(mark[0],) if mark else ())
+        self._fresh_items.add(row_index)
+
+    def _refresh_item(self, row_index):
+        if self.tree.exists(str(row_index)):
+            self.tree.item(str(row_index), values=self._display_values(self.data_rows[row_index], row_index))
+            self._fresh_items.add(row_index)
+
+    def _render_rows(self):
+        """Rebuilds the grid from self.view_rows. Item ids are data row indices
+        (database rowids for out-of-core tables, which only render one page)."""
+        self.tree.delete(*self.tree.get_children())
+        if self.store is not None:
+            self.row_offset = max(0, min(self.row_offset, self.store.count() - self._page_rows() + 1))
+            for rowid, row in self.store.page(self.row_offset, self._page_rows()):
+                self.tree.insert("", "end", iid=str(rowid), values=self._display_values(row))
+            self._update_vsb()
+            return
+        self._fresh_items = set()
+        for row_index in self.view_rows:
+            self._insert_item(row_index)
+
+    def _refresh_visible_values(self):
+        self.ui.mark("rows")
+
+    def _draw_visible_values(self):
+        if self.store is not None:
+            self._render_rows()
+            return
+        # Every item is now out of date, but only those on screen are redrawn; the rest
+        # are redrawn as they scroll into view.
+        self._fresh_items = set()
+        self._draw_scrolled_values()
+
+    def _draw_scrolled_values(self):
+        """Redraws the out-of-date items in the visible part of the grid. Items are in
+        view_rows order, so the scroll fractions locate them without asking Tk."""
+        if self.store is not None or not self.view_rows: return
+        first, last = self.tree.yview()
+        count = len(self.view_rows)
+        start, stop = max(0, int(first * count) - 1), min(count, int(last * count) + 2)
+        for row_index in self.view_rows[start:stop]:
+            if row_index not in self._fresh_items:
+                self._refresh_item(row_index)
+
+    def _show_all_rows(self):
+        if self.store is not None:
+            self.store.set_filter()
+            self.row_offset = 0
+            self._render_rows()
+            return
+        self.view_rows = list(range(len(self.data_rows)))
+        self.row_filter = None
+        self._render_rows()
+
+    def _row_values(self, row_id):
+        """Returns the full row behind a grid item id."""
+        if self.store is not None:
+            return self.store.get_row(int(row_id))
+        return self.data_rows[int(row_id)]
+
+    # ---------------- Out-of-Core Row Paging ----------------
+    def _page_rows(self):
+        height = self.tree.winfo_height()
+        return max(1, (height if height > 1 else 600) // ROW_HEIGHT)
+
+    def _update_vsb(self):
+        count = self.store.count()
+        if not count:
+            self.vsb.set(0, 1)
+            return
+        self.vsb.set(self.row_offset / count, min(1.0, (self.row_offset + self._page_rows()) / count))
+
+    def _on_tree_yscroll(self, first, last):
+        # The Treeview only holds one page of an out-of-core table; its own scroll range is meaningless.
+        if self.store is None:
+            self.vsb.set(first, last)
+            self.ui.mark("visible")
+
+    def _yview(self, *args):
+        if self.store is None:
+            self.tree.yview(*args)
+            return
+        if args[0] == "moveto":
+            self.row_offset = int(float(args[1]) * self.store.count())
+        elif args[0] == "scroll":
+            step = max(1, self._page_rows() - 1) if args[2] == "pages" else 1
+            self.row_offset += int(args[1]) * step
+        self.ui.mark("page")
+
+    def _apply_row_offset(self):
+        if self.store is not None:
+            self._render_rows()
+
+    def _on_mouse_wheel(self, direction):
+        if self.store is None: return None # Let the Treeview scroll itself.
+        self._yview("scroll", direction * 3, "units")
+        return "break"
 
     def handle_header_click(self, event):
         region = self.tree.identify("region", event.x, event.y)
         if region != "heading": return
-        col = self.tree.identify_column(event.x)
-        if not col or col == '#0': return
-        col_index = int(col.replace("#", "")) - 1
+        col_index = self._column_at(event.x)
+        if col_index is None: return
         self.sort_by_column(col_index)
 
     def handle_header_double_click(self, event):
         region = self.tree.identify("region", event.x, event.y)
         if region != "heading": return
-        col = self.tree.identify_column(event.x)
-        col_index = int(col.replace("#", "")) - 1
+        col_index = self._column_at(event.x)
+        if col_index is None: return
         
-        old_name = self.tree["columns"][col_index].replace(' ▲', '').replace(' ▼', '')
+        old_name = self.headers[col_index]
         new_name = simpledialog.askstring("Edit Column", "Enter new column name:", initialvalue=old_name)
         if new_name and new_name != old_name:
-            columns = list(self.tree["columns"])
-            columns[col_index] = new_name
-            self.tree["columns"] = columns
-            self._refresh_headings()
-            self._save_state()
+            op = ("rename_col", col_index, new_name)
+            self._apply_ops(op)
+            self._save_state(op)
             
     def sort_by_column(self, col_index):
+        if not self._require_values_mode("Sorting"): return
         if self.current_sort_col == col_index:
             self.current_sort_reverse = not self.current_sort_reverse
         else:
             self.current_sort_col = col_index
             self.current_sort_reverse = False
-        def convert_value(val):
-            try:
-                if isinstance(val, (int, float)): return float(val)
-                return float(str(val).strip())
-            except (ValueError, TypeError):
-                return str(val).lower()
-        def sort_key(row):
-            try:
-                if col_index < len(row):
-                    val = row[col_index]
-                    return convert_value(val)
-                return ""
-            except IndexError:
-                return ""
-        self.data_rows.sort(key=sort_key, reverse=self.current_sort_reverse)
+        if self.store is not None:
+            self.store.set_order(col_index, self.current_sort_reverse)
+            self.row_offset = 0
+            self._render_rows()
+            self._refresh_headings()
+            self._save_state()
+            return
+        op = ("sort", col_index, self.current_sort_reverse)
+        self._apply_ops(op)
         self.clear_filter()
         self._refresh_headings()
-        self._save_state() 
+        self._save_state(op) 
         
     def edit_cell(self, event):
         row_id = self.tree.identify_row(event.y)
         col = self.tree.identify_column(event.x)
-        if not row_id or not col or col == '#0': return
+        col_index = self._column_at(event.x)
+        if not row_id or col_index is None: return
 
-        col_index = int(col.replace("#", "")) - 1
         x, y, width, height = self.tree.bbox(row_id, column=col)
         
-        current_row_values = list(self.tree.item(row_id, "values"))
-        try:
-            master_row_index = [idx for idx, row in enumerate(self.data_rows) if all(str(row[j]) == str(current_row_values[j]) for j in range(len(current_row_values)))][0]
-        except Exception:
-            return 
-        
-        current_value = self.data_rows[master_row_index][col_index]
+        master_row_index = int(row_id)
+        row = self._row_values(row_id)
+        # From the data, not the item, which may not be redrawn yet for the current column window.
+        current_row_values = self._display_values(row, master_row_index if self.store is None else None)
+        current_value = row[col_index] if col_index < len(row) else ""
 
         self.edit_entry = tk.Entry(self.tree)
         self.edit_entry.place(x=x, y=y, width=width, height=height)
@@ -964,26 +3860,37 @@ class ExcelEditor:
         def update_visuals(event=None):
             new_value = self.edit_entry.get()
             temp_row = list(current_row_values)
-            temp_row[col_index] = new_value
-            self.tree.item(row_id, values=temp_row)
+            temp_row[col_index - self.col_offset] = new_value
+            self._edit_preview = (row_id, temp_row)
+            self.ui.mark("edit_preview")
 
         def finalize_edit(event=None):
+            self._edit_preview = None
             if not self.edit_entry.winfo_exists(): return
             new_value = self.edit_entry.get()
             self.edit_entry.destroy() 
             
-            if new_value != current_value:
-                self.data_rows[master_row_index][col_index] = new_value
-                self.tree.item(row_id, values=self.data_rows[master_row_index]) 
+            if new_value != current_value and self.store is not None:
+                self.store.update(master_row_index, col_index, new_value)
+                self._render_rows()
                 self._save_state()
+            elif new_value != current_value:
+                op = ("set", master_row_index, col_index, new_value)
+                self._apply_ops(op)
+                self._refresh_item(master_row_index)
+                self._save_state(op)
 
         self.edit_entry.bind("<KeyRelease>", update_visuals)
         self.edit_entry.bind("<Return>", finalize_edit)
         self.edit_entry.bind("<FocusOut>", finalize_edit)
 
+    def _draw_edit_preview(self):
+        if self._edit_preview and self.tree.exists(self._edit_preview[0]):
+            self.tree.item(self._edit_preview[0], values=self._edit_preview[1])
+
     def show_context_menu(self, event):
         row_id = self.tree.identify_row(event.y)
-        col = self.tree.identify_column(event.x)
+        col_index = self._column_at(event.x)
         
         self.selected_row_index = None 
         self.selected_col_index = None
@@ -991,16 +3898,11 @@ class ExcelEditor:
         self.selected_cell_value = None
         self.tree.selection_remove(self.tree.selection())
 
-        if row_id and col and col != '#0':
-            self.selected_row = self.tree.item(row_id)["values"]
-            self.selected_col_index = int(col.replace("#", "")) - 1
-            self.selected_cell_value = self.selected_row[self.selected_col_index]
-            
-            try:
-                search_row_str = [str(v) for v in self.selected_row]
-                self.selected_row_index = [idx for idx, row in enumerate(self.data_rows) if [str(v) for v in row] == search_row_str][0]
-            except Exception:
-                pass 
+        if row_id and col_index is not None:
+            self.selected_row_index = int(row_id)
+            self.selected_row = self._row_values(row_id)
+            self.selected_col_index = col_index
+            self.selected_cell_value = self.selected_row[col_index] if col_index < len(self.selected_row) else ""
 
             self.tree.selection_set(row_id)
             self.menu.post(event.x_root, event.y_root)
@@ -1018,6 +3920,7 @@ class ExcelEditor:
             self._update_status_bar("Row copied to clipboard!")
 
     def copy_column(self):
+        if not self._require_in_memory("Copying a whole column"): return
         if self.selected_col_index is not None:
             col_data = [str(row[self.selected_col_index]) for row in self.data_rows if self.selected_col_index < len(row)]
             self.root.clipboard_clear()
@@ -1030,53 +3933,267 @@ class ExcelEditor:
             self.clear_filter()
             return
         
-        filtered_rows = []
-        
-        if ":" in query:
-            parts = query.split(":", 1)
-            if len(parts) < 2: 
-                messagebox.showwarning("Search Format", "Invalid column search format. Use Column:value1,value2,...")
-                self.clear_filter()
-                return
+        try:
+            matches, col_index, values = _search_matcher(self.headers, query)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            self.clear_filter()
+            return
 
-            col_name, values = parts
-            col_name = col_name.strip()
-            values_list = [v.strip().lower() for v in values.split(",") if v.strip()]
-            
-            try:
-                col_index = list(self.tree["columns"]).index(col_name)
-            except ValueError:
-                messagebox.showwarning("Warning", f"Column '{col_name}' not found.")
-                self.clear_filter()
-                return
-            
-            for row in self.data_rows:
-                cell = row[col_index] if col_index < len(row) else ""
-                if cell and any(val in str(cell).lower() for val in values_list):
-                    filtered_rows.append(row)
-        else:
-            value = query.lower()
-            for row in self.data_rows:
-                if any(cell and value in str(cell).lower() for cell in row):
-                    filtered_rows.append(row)
+        if self.store is not None:
+            self._apply_store_filter(col_index, values)
+            return
+        filtered_rows = [i for i, row in enumerate(self.data_rows) if matches(row)]
 
-        self.tree.delete(*self.tree.get_children())
-        for row in filtered_rows:
-            self.tree.insert("", "end", values=row)
+        self.view_rows = filtered_rows
+        self.row_filter = matches
+        self._render_rows()
         
         self._update_status_bar(f"Filter applied. {len(filtered_rows)} of {len(self.data_rows)} rows shown.")
 
+    def _apply_store_filter(self, col_index, values):
+        """Out-of-core filter: one SQL scan, then only the first page is rendered."""
+        self.store.set_filter(col_index, values)
+        self.row_offset = 0
+        self._render_rows()
+        self._update_status_bar(f"Filter applied. {self.store.count()} of {self.store.total()} rows shown.")
+
     def clear_filter(self):
-        self.tree.delete(*self.tree.get_children())
-        for row in self.data_rows:
-            self.tree.insert("", "end", values=row)
+        self._show_all_rows()
         
         self.search_entry.delete(0, tk.END)
         self._restore_placeholder(None) 
         self._update_status_bar()
 
+    # ---------------- Follow Mode ----------------
+    def toggle_follow(self):
+        if not self.follow_mode.get():
+            self._stop_follow()
+            self._update_status_bar("Stopped following the file.")
+            return
+        reason = None
+        if self.file_type != "csv" or not self.file_path or not os.path.exists(self.file_path):
+            reason = "Follow mode works on CSV/TSV files opened from disk."
+        elif self.follow_offset is None:
+            reason = "Compressed files cannot be followed; appended data is only readable after decompressing the whole file."
+        elif self.csv_format["encoding"] == "utf-16":
+            reason = "UTF-16 files cannot be followed."
+        if reason:
+            messagebox.showinfo("Follow File", reason)
+            self.follow_mode.set(False)
+            return
+        if not self._require_in_memory("Following a file"):
+            self.follow_mode.set(False)
+            return
+        self._poll_follow()
 
-if __name__ == "__main__":
+    def _stop_follow(self):
+        if self._follow_id is not None:
+            self.root.after_cancel(self._follow_id)
+            self._follow_id = None
+        self.follow_mode.set(False)
+
+    def _poll_follow(self):
+        """Reads only the bytes appended since the last check and adds their rows."""
+        self._follow_id = None
+        if not self.follow_mode.get(): return
+        try:
+            appended = _read_appended(self.file_path, self.follow_offset, self.csv_format)
+        except OSError as e:
+            self._stop_follow()
+            messagebox.showerror("Follow File", f"Stopped following the file\n{e}")
+            return
+        if appended is None:
+            # Truncated or rotated: start over from the new file unless that would lose edits.
+            if self._has_unsaved_changes():
+                self._stop_follow()
+                messagebox.showwarning("Follow File", "The file was truncated or replaced. Following stopped "
+                                       "to keep your unsaved changes; save them or reopen the file.")
+                return
+            path = self.file_path
+            if not self.open_file(path) or self.store is not None or self.follow_offset is None:
+                self._stop_follow()
+                messagebox.showwarning("Follow File", f"{os.path.basename(path)} was truncated or replaced and "
+                                       "could not be reopened for following. Following stopped.")
+                return
+            self.follow_mode.set(True)
+        else:
+            rows, self.follow_offset = appended
+            if rows and self.follow_partial is not None:
+                self._complete_partial_row(rows.pop(0))
+            if rows:
+                self._append_rows(rows)
+        self._follow_id = self.root.after(FOLLOW_POLL_MS, self._poll_follow)
+
+    def _complete_partial_row(self, row):
+        """Replaces the row loaded from the file's incomplete last line with the whole line."""
+        partial, self.follow_partial = self.follow_partial, None
+        old = list(partial)
+        partial[:] = row
+        for snapshot_rows, _ in self.history:
+            for i in range(len(snapshot_rows) - 1, -1, -1):
+                if snapshot_rows[i] == old:
+                    snapshot_rows[i] = list(row)
+                    break
+        self.formulas = None
+        for row_index in range(len(self.data_rows) - 1, -1, -1):
+            if self.data_rows[row_index] is partial:
+                self._refresh_item(row_index)
+                break
+
+    def _append_rows(self, rows):
+        """Adds rows read from the end of the file without re-rendering the grid; an active
+        filter is applied to the new rows only."""
+        at_bottom = self.tree.yview()[1] >= 1.0
+        start = len(self.data_rows)
+        self.data_rows.extend(rows)
+        # The rows are part of the file, not an edit: every undo step keeps them.
+        for snapshot_rows, _ in self.history:
+            snapshot_rows.extend(list(row) for row in rows)
+        self.formulas = None
+        new_rows = range(start, len(self.data_rows))
+        if self.row_filter is not None:
+            new_rows = [i for i in new_rows if self.row_filter(self.data_rows[i])]
+        self.view_rows.extend(new_rows)
+        for row_index in new_rows:
+            self._insert_item(row_index)
+        if at_bottom and new_rows:
+            self.tree.see(str(new_rows[-1]))
+        if self.row_filter is not None:
+            self._update_status_bar(f"{len(rows)} rows appended, {len(new_rows)} match the filter.")
+        else:
+            self._update_status_bar(f"{len(rows)} rows appended.")
+
+
+# --- Batch Conversion (no GUI) ---
+def _convert_file(src, dst, sheet=None, query=None, sort=None):
+    """Converts one file in a worker process, reusing the editor's readers and writers.
+    Returns (src, dst, rows written, seconds, error message or None)."""
+    start = time.perf_counter()
+    # Written under a temporary name (same extension) so a failed conversion leaves no partial file.
+    partial = os.path.join(os.path.dirname(dst), ".partial-" + os.path.basename(dst))
+    try:
+        rows = _iter_source_rows(src, sheet)
+        headers = next(rows, [])
+        if query:
+            matches = _search_matcher(headers, query)[0]
+            rows = (row for row in rows if matches(row))
+        if sort:
+            col_name, _, direction = sort.partition(":")
+            if col_name not in headers:
+                raise ValueError(f"Column '{col_name}' not found.")
+            rows = list(rows)
+            _sort_rows(rows, headers.index(col_name), direction.lower() == "desc")
+        count = 0
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+        _export_table(partial, headers, counted(rows), sheet_name=sheet)
+        os.replace(partial, dst)
+        return src, dst, count, time.perf_counter() - start, None
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        return src, dst, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+def run_batch(source_dir, to_format, output_dir=None, sheet=None, query=None, sort=None, workers=None):
+    """Converts every supported file in source_dir to `to_format` (csv, tsv, csv.gz, xlsx,
+    parquet, ...) in parallel worker processes. Prints one line per file; returns the exit code."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    output_dir = output_dir or source_dir
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = "." + to_format.lstrip(".").lower()
+    sources = [os.path.join(source_dir, name) for name in sorted(os.listdir(source_dir))
+               if os.path.isfile(os.path.join(source_dir, name))
+               and (name.lower().endswith((".xlsx", ".xls")) or _is_delimited_path(name) or _columnar_kind(name))]
+    # Destinations are planned up front so no job overwrites a source file or another job's output.
+    def path_key(path): return os.path.normcase(os.path.abspath(path))
+    source_keys = {path_key(src) for src in sources}
+    claimed = {}
+    jobs, conflicts = [], []
+    for src in sources:
+        dst = os.path.join(output_dir, os.path.splitext(os.path.basename(_split_compression(src)[0]))[0] + suffix)
+        key = path_key(dst)
+        if key == path_key(src): continue # Already in the target format.
+        if key in source_keys:
+            conflicts.append((src, f"{os.path.basename(dst)} is another source file and would be overwritten"))
+        elif key in claimed:
+            conflicts.append((src, f"{os.path.basename(dst)} is also the output of {os.path.basename(claimed[key])}"))
+        else:
+            claimed[key] = src
+            jobs.append((src, dst))
+    if not jobs and not conflicts:
+        print(f"No files to convert in {source_dir}.")
+        return 0
+
+    start = time.perf_counter()
+    failures = len(conflicts)
+    for src, error in conflicts:
+        print(f"FAILED {os.path.basename(src)}: {error}", flush=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_convert_file, src, dst, sheet, query, sort) for src, dst in jobs]
+        for future in as_completed(futures):
+            src, dst, count, seconds, error = future.result()
+            if error:
+                failures += 1
+                print(f"FAILED {os.path.basename(src)} ({seconds:.2f} s): {error}", flush=True)
+            else:
+                print(f"ok     {os.path.basename(src)} -> {os.path.basename(dst)}: {count} rows in {seconds:.2f} s", flush=True)
+    print(f"{len(jobs) + len(conflicts) - failures} of {len(jobs) + len(conflicts)} files converted in {time.perf_counter() - start:.2f} s"
+          f"{f', {failures} failed' if failures else ''}.")
+    return 1 if failures else 0
+
+def _parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Cells - Excel/CSV data editor.")
+    parser.add_argument("files", nargs="*", help="Files to open (.xlsx, .csv/.tsv optionally .gz/.bz2/.xz compressed, .parquet/.feather). Extra files open in their own windows.")
+    parser.add_argument("--sheet", help="Sheet to show after opening an Excel file.")
+    parser.add_argument("--columns", metavar="NAMES",
+                        help="Comma-separated columns to load from a Parquet/Feather file.")
+    parser.add_argument("--filter", metavar="QUERY", help="Search filter to apply (keyword or Column:value1,value2).")
+    parser.add_argument("--formulas", action="store_true",
+                        help="Open Excel files in formula mode (keep and evaluate formulas).")
+    parser.add_argument("--out-of-core", action="store_true", default=None,
+                        help="Keep rows in a temporary SQLite database instead of memory (for very large files).")
+    parser.add_argument("--follow", action="store_true",
+                        help="Follow the opened CSV files, showing rows as they are appended.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Start tracemalloc at launch so Help > Memory Diagnostics can attribute all allocations.")
+    batch = parser.add_argument_group("batch conversion (no window is opened)")
+    batch.add_argument("--batch", metavar="DIR", help="Convert every supported file in DIR (uses --sheet and --filter).")
+    batch.add_argument("--to", default="csv", metavar="FORMAT",
+                       help="Target format: csv, tsv, csv.gz, xlsx, parquet, feather (default: csv).")
+    batch.add_argument("--output", metavar="DIR", help="Directory for converted files (default: the source directory).")
+    batch.add_argument("--sort", metavar="COLUMN[:desc]", help="Sort rows by a column while converting.")
+    batch.add_argument("--workers", type=int, metavar="N", help="Worker processes (default: one per CPU).")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_MS, metavar="MS",
+                        help=f"Startup time budget in milliseconds (default: {STARTUP_BUDGET_MS}).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.to, args.output, args.sheet, args.filter, args.sort, args.workers))
     root = tk.Tk()
     app = ExcelEditor(root)
+    app.formula_mode.set(args.formulas)
+    for i, file_path in enumerate(args.files):
+        editor = app if i == 0 else ExcelEditor(tk.Toplevel(root))
+        editor.formula_mode.set(args.formulas)
+        columns = [name.strip() for name in args.columns.split(",")] if args.columns else None
+        editor.open_from_command_line(file_path, sheet=args.sheet, query=args.filter, columns=columns,
+                                      out_of_core=args.out_of_core)
+        if args.follow:
+            editor.follow_mode.set(True)
+            editor.toggle_follow()
+    root.after_idle(app.report_startup_time, args.startup_budget)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()